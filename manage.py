@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meal_project.settings') # Ensure this matches your inner project folder name
+    # Tests run against meal_project/test_settings.py, which stands in for the apps outside this repository
+    settings_module = 'meal_project.test_settings' if sys.argv[1:2] == ['test'] else 'meal_project.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module) # Ensure this matches your inner project folder name
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
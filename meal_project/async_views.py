@@ -0,0 +1,65 @@
+# meal_project/async_views.py
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from users.authentication import CachedTokenAuthentication
+
+
+def select_view(sync_view, async_view):
+    """The view to route a URL to: `async_view` when settings.ASYNC_VIEWS is on, else `sync_view`."""
+    view = async_view if getattr(settings, 'ASYNC_VIEWS', False) else sync_view
+    return view.as_view()
+
+
+class AsyncAPIView(View):
+    """
+    Base for the async-native variants of DRF views. DRF only runs sync handlers, so under
+    ASGI every request to an APIView is handed to a worker thread; these stay on the event
+    loop and use the async ORM.
+
+    Handlers get a DRF Request (query_params, data parsed by the DRF parsers) authenticated
+    with CachedTokenAuthentication, and may raise APIExceptions or Http404, answered in
+    DRF's error format. Methods without an async handler are served by `sync_view`, so a
+    route can switch to the async variant even when only some methods have one.
+    """
+    sync_view = None
+    authentication = CachedTokenAuthentication()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token-authenticated API endpoint, exempt from CSRF like DRF's APIView
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        handler = getattr(self, method, None) if method in self.http_method_names else None
+        if handler is None and self.sync_view is not None:
+            return await sync_to_async(self.sync_view.as_view())(request, *args, **kwargs)
+
+        drf_request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+        try:
+            authenticated = await self.authentication.aauthenticate(request)
+            if authenticated is None:
+                raise exceptions.NotAuthenticated()
+            drf_request.user, drf_request.auth = authenticated
+            if handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+            return await handler(drf_request, *args, **kwargs)
+        except Http404 as exc:
+            return JsonResponse({'detail': str(exc)}, status=404)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    def handle_exception(self, exc):
+        detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = JsonResponse(detail, status=exc.status_code, safe=False)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response['WWW-Authenticate'] = self.authentication.authenticate_header(None)
+        return response
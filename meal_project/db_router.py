@@ -0,0 +1,154 @@
+# meal_project/db_router.py
+
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+from users.caching import is_process_local_cache
+
+PRIMARY = 'default'
+
+# True while reads may go to a replica. Off by default, so migrations, management commands
+# and shells read their own writes; ReplicaRoutingMiddleware turns it on for safe requests
+_replica_reads = ContextVar('db_replica_reads', default=False)
+
+DEFAULTS = {
+    'REPLICAS': [],  # DATABASES aliases that serve reads
+    'STICKY_SECONDS': 5,  # How long a client keeps reading from the primary after a write
+    'CACHE_ALIAS': None,  # Shared CACHES alias holding per-client markers too, or None
+    'COOKIE_NAME': 'db_pin',  # Marker sent to every client after a write
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'DATABASE_REPLICATION', {})}
+
+
+@contextmanager
+def _reads_from_replicas(allowed):
+    token = _replica_reads.set(allowed)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def use_primary():
+    """Send every read in the block to the primary (e.g. read-modify-write inside a GET)."""
+    return _reads_from_replicas(False)
+
+
+def use_replicas():
+    """Let reads in the block go to the replicas (e.g. read-only reports in a command)."""
+    return _reads_from_replicas(True)
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes go to the primary; reads go to a random replica only where ReplicaRoutingMiddleware
+    or `use_replicas()` allowed it, and to the primary everywhere else.
+    """
+    def db_for_read(self, model, **hints):
+        replicas = get_config()['REPLICAS']
+        if not replicas or not _replica_reads.get():
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db == PRIMARY
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Pins requests to the primary when replica lag could show stale data:
+
+    - unsafe methods (POST/PUT/PATCH/DELETE) read from the primary for the whole request, so
+      read-modify-write paths (select_for_update, get-or-create) never see a replica;
+    - after a successful write the client stays on the primary for STICKY_SECONDS, so the
+      user who just rated a recipe sees their rating in the next list. The response carries a
+      short-lived cookie that pins whichever worker serves the next request; with CACHE_ALIAS
+      set, a marker keyed by a hash of the Authorization header (or session) also pins
+      clients that drop cookies. That cache must be shared by every worker, so a process-local
+      one is refused at startup.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        config = get_config()
+        if config['REPLICAS'] and config['CACHE_ALIAS'] is not None and is_process_local_cache(caches[config['CACHE_ALIAS']]):
+            raise ImproperlyConfigured(
+                f"DATABASE_REPLICATION['CACHE_ALIAS'] points at the process-local cache '{config['CACHE_ALIAS']}'; "
+                "use a cache shared by every worker, or None to pin clients with the cookie only."
+            )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = get_config()
+        if not config['REPLICAS']:
+            return self.get_response(request)
+
+        writing = request.method not in ('GET', 'HEAD', 'OPTIONS')
+        marker = self._marker_key(config, request)
+        pinned = writing or config['COOKIE_NAME'] in request.COOKIES
+        pinned = pinned or (marker is not None and caches[config['CACHE_ALIAS']].get(marker) is not None)
+
+        with _reads_from_replicas(not pinned):
+            response = self.get_response(request)
+
+        if writing and response.status_code < 400:
+            if marker is not None:
+                caches[config['CACHE_ALIAS']].set(marker, 1, config['STICKY_SECONDS'])
+            self._pin_cookie(config, response)
+        return response
+
+    async def __acall__(self, request):
+        # Same as __call__; the context variable reaches the threads sync_to_async runs the ORM on
+        config = get_config()
+        if not config['REPLICAS']:
+            return await self.get_response(request)
+
+        writing = request.method not in ('GET', 'HEAD', 'OPTIONS')
+        marker = self._marker_key(config, request)
+        pinned = writing or config['COOKIE_NAME'] in request.COOKIES
+        pinned = pinned or (marker is not None and await caches[config['CACHE_ALIAS']].aget(marker) is not None)
+
+        with _reads_from_replicas(not pinned):
+            response = await self.get_response(request)
+
+        if writing and response.status_code < 400:
+            if marker is not None:
+                await caches[config['CACHE_ALIAS']].aset(marker, 1, config['STICKY_SECONDS'])
+            self._pin_cookie(config, response)
+        return response
+
+    def _pin_cookie(self, config, response):
+        response.set_cookie(config['COOKIE_NAME'], '1', max_age=config['STICKY_SECONDS'], httponly=True, samesite='Lax')
+
+    def _marker_key(self, config, request):
+        if config['CACHE_ALIAS'] is None:
+            return None
+        identity = request.META.get('HTTP_AUTHORIZATION')
+        if not identity:
+            identity = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not identity:
+            return None
+        return 'db:pin:' + hashlib.sha256(identity.encode()).hexdigest()
@@ -0,0 +1,159 @@
+# meal_project/middleware.py
+
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('meal_project.queries')
+
+DEFAULTS = {
+    'HEADERS': False,  # Add X-DB-* headers to every response
+    'LOG_EVERY': 1000,  # Log the aggregated per-view stats every N requests (0 disables)
+    'DEFAULT_BUDGET': None,  # Max queries per request for views without their own budget
+    'BUDGETS': {},  # {view_name: max queries per request}
+    'STRICT': False,  # Raise QueryBudgetExceeded instead of logging (for tests)
+    'DUPLICATE_THRESHOLD': 3,  # Same SQL this many times in one request is logged as a likely N+1
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'QUERY_INSTRUMENTATION', {})}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCollector:
+    """execute_wrapper recording every query run while it's installed."""
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            # The SQL still has its placeholders, so repeated lookups differing only by
+            # parameters (the N+1 pattern) share a fingerprint
+            self.fingerprints[sql] += 1
+
+    def duplicates(self, threshold=2):
+        return {sql: times for sql, times in self.fingerprints.items() if times >= threshold}
+
+
+class QueryStats:
+    """Per-view totals aggregated over the requests served by this process."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._requests = 0
+
+    def record(self, view_name, collector):
+        duplicated = sum(times - 1 for times in collector.fingerprints.values())
+        with self._lock:
+            stats = self._views.setdefault(view_name, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'db_time': 0.0, 'duplicated_queries': 0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += collector.count
+            stats['max_queries'] = max(stats['max_queries'], collector.count)
+            stats['db_time'] += collector.duration
+            stats['duplicated_queries'] += duplicated
+            self._requests += 1
+            return self._requests
+
+    def snapshot(self):
+        with self._lock:
+            return {view_name: dict(stats) for view_name, stats in self._views.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._requests = 0
+
+
+query_stats = QueryStats()
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Counts the queries, DB time and repeated SQL of every request, per view.
+
+    - QUERY_INSTRUMENTATION['HEADERS'] adds X-DB-Query-Count, X-DB-Time-Ms and
+      X-DB-Duplicate-Queries to responses (on in DEBUG).
+    - Per-view totals are kept in `query_stats` and logged every LOG_EVERY requests.
+    - Requests over their view's budget, or repeating the same SQL DUPLICATE_THRESHOLD
+      times, are logged; with STRICT the budget check raises QueryBudgetExceeded instead,
+      so tests fail on query regressions.
+
+    Queries run while a streaming response is consumed happen after the middleware
+    returns and aren't counted. Under ASGI the wrappers are installed on the request's
+    thread-sensitive worker thread, where async views' ORM calls run.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        collector = QueryCollector()
+        with ExitStack() as stack:
+            self._install(stack, collector)
+            response = self.get_response(request)
+        return self._finish(request, response, collector)
+
+    async def __acall__(self, request):
+        collector = QueryCollector()
+        stack = ExitStack()
+        await sync_to_async(self._install)(stack, collector)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._finish(request, response, collector)
+
+    def _install(self, stack, collector):
+        # Connections are per thread: this must run on the thread executing the queries
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(collector))
+
+    def _finish(self, request, response, collector):
+        config = get_config()
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+
+        if config['HEADERS']:
+            response['X-DB-Query-Count'] = str(collector.count)
+            response['X-DB-Time-Ms'] = f'{collector.duration * 1000:.2f}'
+            response['X-DB-Duplicate-Queries'] = str(sum(times - 1 for times in collector.fingerprints.values()))
+
+        served = query_stats.record(view_name, collector)
+        if config['LOG_EVERY'] and served % config['LOG_EVERY'] == 0:
+            logger.info('Query stats per view: %s', query_stats.snapshot())
+
+        for sql, times in collector.duplicates(config['DUPLICATE_THRESHOLD']).items():
+            logger.warning('%s ran the same query %d times (likely N+1): %s', view_name, times, sql)
+
+        budget = config['BUDGETS'].get(view_name, config['DEFAULT_BUDGET'])
+        if budget is not None and collector.count > budget:
+            message = f'{view_name} ran {collector.count} queries, over its budget of {budget}'
+            if config['STRICT']:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -57,6 +60,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'meal_project.middleware.QueryInstrumentationMiddleware', # First, so it sees the queries of every other middleware
+    'meal_project.db_router.ReplicaRoutingMiddleware', # No-op unless read replicas are configured
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -91,12 +96,84 @@ WSGI_APPLICATION = 'meal_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE selects the profile: 'sqlite' (default, single node) or 'postgres' (production).
+
+def _env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'meal_planner'),
+            'USER': os.environ.get('DB_USER', 'meal_planner'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Persistent connections skip the connect/auth handshake on every request;
+            # health checks drop connections the server closed while they sat idle
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
     }
+    if _env_bool('DB_POOL', False):
+        # psycopg 3 connection pool, shared by the threads of one worker process. Django
+        # rejects pooling combined with persistent connections, so CONN_MAX_AGE goes to 0
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+    # Read replicas: DB_REPLICA_HOSTS=host1,host2 adds aliases replica_1, replica_2, ... that
+    # share the primary's settings apart from the host. Tests mirror them onto the primary
+    for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+        DATABASES[f'replica_{index}'] = {
+            **DATABASES['default'],
+            'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+            'HOST': host.strip(),
+            'TEST': {'MIRROR': 'default'},
+        }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # WAL lets readers run alongside the single writer; NORMAL sync is safe under WAL.
+                # IMMEDIATE transactions take the write lock up front, so concurrent writers wait
+                # out the busy timeout instead of failing with "database is locked" on upgrade
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': int(os.environ.get('DB_BUSY_TIMEOUT', 20)),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_ENGINE {DB_ENGINE!r}; expected 'sqlite' or 'postgres'.")
+
+# Safe-method reads go to the replicas and writes to the primary (meal_project.db_router);
+# a client that just wrote keeps reading from the primary for STICKY_SECONDS to hide lag.
+# The pin travels in a cookie; CACHE_ALIAS may name a cache shared by every worker to also
+# pin clients that drop cookies (a process-local cache is refused at startup).
+DATABASE_REPLICATION = {
+    'REPLICAS': [alias for alias in DATABASES if alias.startswith('replica_')],
+    'STICKY_SECONDS': 5,
+    'CACHE_ALIAS': None,
+    'COOKIE_NAME': 'db_pin',
 }
+DATABASE_ROUTERS = ['meal_project.db_router.PrimaryReplicaRouter'] if DATABASE_REPLICATION['REPLICAS'] else []
+
+# Serve the favorites/ratings list, create and detail routes, profile GET and Google login
+# with their async-native variants (always reachable under .../async/ too). Meant for ASGI
+# deployments (meal_project.asgi); under WSGI each async view runs in an event loop of its own.
+ASYNC_VIEWS = _env_bool('ASYNC_VIEWS', False)
 
 
 # Password validation
@@ -118,6 +195,34 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# PASSWORD_HASHER_PROFILE picks the algorithm new hashes are made with ('pbkdf2', 'scrypt'
+# or 'argon2', the latter needs argon2-cffi); PASSWORD_HASHER_PARAMS tunes its cost. The
+# other hashers stay listed so existing hashes still verify, and Django rehashes a user's
+# password with the current profile/params on their next successful login.
+# `manage.py benchmark_password_hashers` reports hashes/sec per profile to tune against.
+PASSWORD_HASHER_PROFILE = os.environ.get('PASSWORD_HASHER_PROFILE', 'pbkdf2')
+
+PASSWORD_HASHER_PARAMS = {
+    'pbkdf2': {'iterations': 1_000_000},
+    'scrypt': {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 1},
+    'argon2': {'time_cost': 2, 'memory_cost': 64 * 1024, 'parallelism': 2},  # memory_cost in KiB
+}
+
+_PROFILE_HASHERS = {
+    'pbkdf2': 'users.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'users.hashers.TunedScryptPasswordHasher',
+    'argon2': 'users.hashers.TunedArgon2PasswordHasher',
+}
+
+PASSWORD_HASHERS = [_PROFILE_HASHERS[PASSWORD_HASHER_PROFILE]] + [
+    hasher for profile, hasher in _PROFILE_HASHERS.items() if profile != PASSWORD_HASHER_PROFILE
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -137,7 +242,7 @@ LOCALE_PATHS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication', # <--- Make sure this is present
+        'users.authentication.CachedTokenAuthentication', # TokenAuthentication with a cached token -> user lookup
         # 'rest_framework.authentication.SessionAuthentication', # Optional, useful for browser API
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -145,6 +250,105 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Lifetime of API auth tokens in seconds (None: tokens never expire). Expired tokens are
+# rejected, replaced on the next login and deleted by `manage.py purge_expired_tokens`.
+AUTH_TOKEN_TTL = 60 * 60 * 24 * 14
+
+# Cache for token -> user lookups done by users.authentication.CachedTokenAuthentication.
+# 'none' (default) loads the token on every request. 'django' uses the CACHES alias below:
+# logout, password changes and deactivation revoke the cached token at once in every worker
+# sharing it, so the alias must be a shared backend (Redis, Memcached, database); a
+# process-local one fails the users.E002 check. 'local' keeps a per-process LRU instead, for
+# single-process deployments: invalidations only reach the current process, and a revoked
+# token keeps authenticating on any other worker for up to TIMEOUT seconds.
+TOKEN_AUTH_CACHE = {
+    'BACKEND': 'none',
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,  # seconds
+    'MAX_ENTRIES': 10000,
+}
+
+# Cache (CACHES alias) holding the serialized profile/preferences payloads served by
+# UserProfileView and DietaryPreferenceView, and how long an entry may live in seconds.
+# It also holds the per-user versions behind their ETags, so it must be shared by every
+# worker: a process-local alias (LocMemCache) fails the users.E001 check. None (default)
+# turns payload caching off; payloads are then built per request.
+USER_PAYLOAD_CACHE_ALIAS = None
+USER_PAYLOAD_CACHE_TIMEOUT = 60 * 60
+
+# Token-bucket throttling of login and password-change attempts (users/throttling.py), checked
+# before any password is hashed. RATES are 'burst/period': a client IP or account gets that
+# many attempts at once, refilled evenly over the period. 'local' keeps the buckets per
+# process (each worker allows the full rate); 'django' shares them through the CACHES alias
+# below; a dotted path selects a custom store. Rejections are counted per scope and logged
+# every LOG_EVERY rejections.
+LOGIN_THROTTLE = {
+    'ENABLED': True,
+    'BACKEND': 'local',
+    'CACHE_ALIAS': 'default',
+    'MAX_ENTRIES': 100000,
+    'RATES': {'ip': '30/min', 'account': '10/min'},
+    'LOG_EVERY': 100,
+}
+
+# Per-request query counting done by meal_project.middleware.QueryInstrumentationMiddleware.
+# BUDGETS maps view names (e.g. 'user-profile') to the most queries a request may run.
+QUERY_INSTRUMENTATION = {
+    'HEADERS': DEBUG,
+    'LOG_EVERY': 1000,
+    'DEFAULT_BUDGET': None,
+    'BUDGETS': {},
+    'STRICT': False,
+    'DUPLICATE_THRESHOLD': 3,
+}
+
+# Page size for the cursor-paginated favorites/ratings lists; clients may ask for
+# up to RATING_MAX_PAGE_SIZE items with ?page_size=
+RATING_PAGE_SIZE = 50
+RATING_MAX_PAGE_SIZE = 200
+# Largest batch accepted by the favorites/ratings bulk endpoints
+RATING_BULK_MAX_ITEMS = 500
+# Most recipe IDs the status endpoint answers for in one request
+RATING_STATUS_MAX_IDS = 100
+# Per-user cache of favorited recipe IDs used by the status endpoint (rating/caching.py):
+# a compact sorted ID array per user, dropped on every favorite write
+RATING_FAVORITE_ID_CACHE = {
+    'ENABLED': False,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60 * 60,  # seconds
+}
+
+# Recipe leaderboards, stored as LeaderboardEntry rows. Every rating and favorite write
+# re-ranks the recipes it touched; `manage.py refresh_leaderboards` rebuilds the boards to
+# expire old activity out of the windows and repair drift (run it periodically, e.g. hourly
+# from cron). WINDOWS maps a window name to its length in days (None
+# for all time); SIZE is how many recipes each board keeps. Top-rated boards rank by a
+# Bayesian average that pulls recipes with few ratings towards the board's mean rating as if
+# they had PRIOR_WEIGHT extra average ratings.
+LEADERBOARD = {
+    'WINDOWS': {'7d': 7, '30d': 30, 'all': None},
+    'SIZE': 100,
+    'PRIOR_WEIGHT': 10,
+}
+
+# Item-based recommendations (rating.recommender, `manage.py build_recommendations`, needs
+# numpy and scipy). NEIGHBORS similar recipes are stored per recipe; a favorite counts as
+# FAVORITE_WEIGHT next to a rating's stars / 5. Serving scores the neighbors of the user's
+# SEED_ITEMS most recent ratings and favorites. RECIPE_TAG_LOOKUP is the ORM path from a
+# recipe to the names of its dietary tags (e.g. 'dietary_tags__name'); when set, users only
+# get recipes tagged with all of their DietaryPreference tags.
+RECOMMENDER = {
+    'NEIGHBORS': 50,
+    'MIN_SIMILARITY': 0.01,
+    'FAVORITE_WEIGHT': 1.0,
+    'SEED_ITEMS': 50,
+    'MAX_RESULTS': 50,
+    'RECIPE_TAG_LOOKUP': None,
+    # `build_recommendations --incremental` leaves change log events this recent for the
+    # next run, so write transactions still committing aren't skipped past
+    'SETTLE_SECONDS': 5,
+}
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
@@ -189,7 +393,7 @@ CORS_ALLOWED_HEADERS = [
 ]
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    'users.backends.UsernameOrEmailBackend',  # ModelBackend that also accepts the email
     'allauth.account.auth_backends.AuthenticationBackend',
 ]
 
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class TestRecipesConfig(AppConfig):
+    """Stand-in for the recipes app under meal_project.test_settings, when it isn't installed."""
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'meal_project.test_recipes'
+    label = 'recipes'
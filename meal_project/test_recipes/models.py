@@ -0,0 +1,9 @@
+from django.db import models
+
+
+class Recipe(models.Model):
+    """Just what the rating and users apps rely on: a primary key and a title."""
+    title = models.CharField(max_length=200)
+
+    def __str__(self):
+        return self.title
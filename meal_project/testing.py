@@ -0,0 +1,50 @@
+# meal_project/testing.py
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from users.authentication import reset_token_cache
+from users.throttling import reset_bucket_store
+
+# CACHES plus a 'shared' alias every process can see, for the settings that refuse a
+# process-local cache (token cache, payload cache, replica pins)
+SHARED_TEST_CACHES = {**settings.CACHES, 'shared': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), 'meal-project-test-cache'),
+}}
+SHARED_TOKEN_AUTH_CACHE = {'BACKEND': 'django', 'CACHE_ALIAS': 'shared', 'TIMEOUT': 300}
+
+
+class QueryBudgetMixin:
+    """
+    TestCase helpers asserting upper bounds on the queries a block runs and on response
+    sizes, so a stray per-row lookup or an unpaginated list fails the suite.
+    """
+    def setUp(self):
+        super().setUp()
+        # Start every test cold. Cached payloads are also keyed by user ID, which the test
+        # database may hand out again.
+        for cache in caches.all():
+            cache.clear()
+        reset_token_cache()
+        reset_bucket_store()
+
+    @contextmanager
+    def assertMaxQueries(self, max_queries, using='default'):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = [query['sql'] for query in context.captured_queries]
+        self.assertLessEqual(
+            len(executed), max_queries,
+            f'{len(executed)} queries executed, budget is {max_queries}:\n' + '\n'.join(executed),
+        )
+
+    def assertMaxResponseSize(self, response, max_bytes):
+        size = len(response.content)
+        self.assertLessEqual(size, max_bytes, f'Response is {size} bytes, budget is {max_bytes}')
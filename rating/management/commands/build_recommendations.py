@@ -0,0 +1,148 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from rating.models import ChangeLogCheckpoint, FavoriteRecipe, RatingEvent, RecipeRating, RecipeSimilarity
+
+CHECKPOINT = 'recommendations'
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the item-item recipe similarities behind the recommendations endpoint from "
+        "every rating and favorite, or with --incremental only for the recipes touched since "
+        "the last run according to the RatingEvent change log (requires numpy and scipy)."
+    )
+
+    def add_arguments(self, parser):
+        config = settings.RECOMMENDER
+        parser.add_argument('--neighbors', type=int, default=config['NEIGHBORS'], help="Similar recipes kept per recipe.")
+        parser.add_argument('--min-similarity', type=float, default=config['MIN_SIMILARITY'])
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help="Only recompute recipes with rating/favorite events since the last checkpoint.",
+        )
+        parser.add_argument(
+            '--prune-events', action='store_true',
+            help="Afterwards delete the change log events every consumer has processed.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            from rating import recommender
+        except ImportError as exc:
+            raise CommandError(f"build_recommendations needs numpy and scipy ({exc}).")
+
+        started = time.perf_counter()
+        if options['incremental']:
+            self.incremental(recommender, options)
+        else:
+            self.full(recommender, options)
+        if options['prune_events']:
+            processed = ChangeLogCheckpoint.objects.aggregate(last=Min('last_event_id'))['last'] or 0
+            deleted, _ = RatingEvent.objects.filter(id__lte=processed).delete()
+            self.stdout.write(f"Pruned {deleted} processed events.")
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s."))
+
+    def full(self, recommender, options):
+        # Everything logged before the data is loaded is reflected in the result
+        last_event_id = RatingEvent.objects.aggregate(last=Max('id'))['last'] or 0
+        recipes, matrix = recommender.build_matrix(*recommender.load_interactions(settings.RECOMMENDER['FAVORITE_WEIGHT']))
+        self.stdout.write(f"Loaded {matrix.nnz} interactions: {matrix.shape[0]} users x {matrix.shape[1]} recipes")
+
+        rows = [
+            RecipeSimilarity(recipe_id=int(recipes[column]), similar_id=int(recipes[neighbor]), score=float(score))
+            for column, neighbor_columns, scores in recommender.top_neighbors(
+                matrix, options['neighbors'], min_similarity=options['min_similarity'],
+            )
+            for neighbor, score in zip(neighbor_columns, scores)
+        ]
+        with transaction.atomic():
+            RecipeSimilarity.objects.all().delete()
+            RecipeSimilarity.objects.bulk_create(rows, batch_size=2000)
+            ChangeLogCheckpoint.objects.update_or_create(name=CHECKPOINT, defaults={'last_event_id': last_event_id})
+        self.stdout.write(f"Stored {len(rows)} similarities for {matrix.shape[1]} recipes.")
+
+    def incremental(self, recommender, options):
+        """
+        Recompute the neighbor lists of the recipes touched since the checkpoint, and patch
+        the touched recipes' scores into the other recipes' lists.
+
+        Only the users who rated or favorited a touched recipe are loaded: they are the only
+        rows contributing to its similarities, and column_norms() supplies the exact norms of
+        the other recipes. Events are consumed up to the newest one older than
+        SETTLE_SECONDS, so write transactions still in flight when the run starts (whose ids
+        may be lower than committed ones) aren't skipped. Other recipes' lists get exact scores
+        for the touched recipes, but a touched recipe whose score fell keeps its place even when
+        a recipe beyond the stored top `neighbors` now outranks it; schedule a full build
+        (e.g. nightly) next to the frequent incremental runs.
+        """
+        config = settings.RECOMMENDER
+        favorite_weight, neighbors, min_similarity = config['FAVORITE_WEIGHT'], options['neighbors'], options['min_similarity']
+        checkpoint, _ = ChangeLogCheckpoint.objects.get_or_create(name=CHECKPOINT)
+        settled = timezone.now() - timedelta(seconds=config['SETTLE_SECONDS'])
+        events = RatingEvent.objects.filter(id__gt=checkpoint.last_event_id, created_at__lte=settled)
+        last_event_id = events.aggregate(last=Max('id'))['last']
+        if last_event_id is None:
+            self.stdout.write("No new events.")
+            return
+        touched = set(events.filter(id__lte=last_event_id).values_list('recipe_id', flat=True).distinct())
+
+        users = set(RecipeRating.objects.filter(recipe_id__in=touched).values_list('user_id', flat=True))
+        users.update(FavoriteRecipe.objects.filter(recipe_id__in=touched).values_list('user_id', flat=True))
+        recipes, matrix = recommender.build_matrix(*recommender.load_interactions(favorite_weight, users=list(users)))
+        norms = recommender.column_norms(recipes, favorite_weight)
+        column_of = {recipe_id: column for column, recipe_id in enumerate(recipes.tolist())}
+        columns = [column_of[recipe_id] for recipe_id in touched if recipe_id in column_of]
+
+        lists = {recipe_id: {} for recipe_id in touched} # Touched recipes are rebuilt from scratch
+        scores_of_touched = defaultdict(dict) # {other recipe: {touched recipe: similarity}}
+        if columns:
+            for block, similarities in recommender.similarity_blocks(matrix, columns, norms):
+                for offset, column in enumerate(block):
+                    vector = similarities[:, offset]
+                    recipe_id = int(recipes[column])
+                    similar = vector.nonzero()[0]
+                    similar = similar[vector[similar] > min_similarity]
+                    best = similar[(-vector[similar]).argsort(kind='stable')[:neighbors]]
+                    lists[recipe_id] = {int(recipes[other]): float(vector[other]) for other in best}
+                    for other in similar:
+                        scores_of_touched[int(recipes[other])][recipe_id] = float(vector[other])
+
+        # Other recipes whose list holds, or should now hold, a touched recipe
+        others = set(scores_of_touched)
+        others.update(RecipeSimilarity.objects.filter(similar_id__in=touched).values_list('recipe_id', flat=True))
+        others -= touched
+        current = defaultdict(dict)
+        for recipe_id, similar_id, score in RecipeSimilarity.objects.filter(recipe_id__in=others).values_list('recipe_id', 'similar_id', 'score'):
+            current[recipe_id][similar_id] = score
+        for recipe_id in others:
+            entries = current[recipe_id]
+            for similar_id in touched:
+                score = scores_of_touched[recipe_id].get(similar_id, 0)
+                if score > min_similarity:
+                    entries[similar_id] = score
+                else:
+                    entries.pop(similar_id, None)
+            lists[recipe_id] = dict(sorted(entries.items(), key=lambda item: -item[1])[:neighbors])
+
+        rows = [
+            RecipeSimilarity(recipe_id=recipe_id, similar_id=similar_id, score=score)
+            for recipe_id, entries in lists.items()
+            for similar_id, score in entries.items()
+        ]
+        with transaction.atomic():
+            RecipeSimilarity.objects.filter(recipe_id__in=lists).delete()
+            RecipeSimilarity.objects.bulk_create(rows, batch_size=2000)
+            checkpoint.last_event_id = last_event_id
+            checkpoint.save(update_fields=['last_event_id', 'updated_at'])
+        self.stdout.write(
+            f"{len(touched)} touched recipes, {len(users)} users loaded, "
+            f"{len(lists)} neighbor lists rewritten, checkpoint at event {last_event_id}."
+        )
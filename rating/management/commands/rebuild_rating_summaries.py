@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from rating.models import STAR_VALUES, RecipeRating, RecipeRatingSummary
+
+
+class Command(BaseCommand):
+    help = "Recompute every recipe rating summary from the RecipeRating table (backfill / repair)."
+
+    def handle(self, *args, **options):
+        totals = RecipeRating.objects.values('recipe').annotate(
+            rating_count=Count('id'),
+            rating_sum=Sum('rating'),
+            **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in STAR_VALUES},
+        )
+        summaries = [
+            RecipeRatingSummary(recipe_id=row.pop('recipe'), **row)
+            for row in totals.iterator(chunk_size=2000)
+        ]
+        with transaction.atomic():
+            RecipeRatingSummary.objects.all().delete()
+            RecipeRatingSummary.objects.bulk_create(summaries, batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating summaries for {len(summaries)} recipes."))
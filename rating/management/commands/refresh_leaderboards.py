@@ -0,0 +1,85 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from rating.models import FavoriteRecipe, LeaderboardEntry, RecipeActivity, RecipeRating
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the top-rated and most-favorited leaderboards (global and per region, for "
+        "every window in settings.LEADERBOARD) from the daily RecipeActivity buckets. Writes "
+        "keep the boards current; run this periodically to expire old activity out of the "
+        "windows and to repair what the incremental updates approximate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild-activity', action='store_true',
+            help="First recompute the activity buckets from the RecipeRating/FavoriteRecipe tables (backfill / repair).",
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild_activity']:
+            self.rebuild_activity()
+
+        config = settings.LEADERBOARD
+        now = timezone.now()
+        for window, days in config['WINDOWS'].items():
+            buckets = RecipeActivity.objects.all()
+            if days is not None:
+                buckets = buckets.filter(day__gt=timezone.localdate(now) - timedelta(days=days))
+            totals = buckets.values('region', 'recipe').annotate(
+                ratings=Sum('rating_count'), stars=Sum('rating_sum'), favorites=Sum('favorite_count'),
+            )
+
+            # {region: {recipe_id: [ratings, stars, favorites]}}, '' being all regions together
+            scopes = defaultdict(lambda: defaultdict(lambda: [0, 0, 0]))
+            for row in totals.iterator(chunk_size=2000):
+                for region in (row['region'], ''):
+                    counters = scopes[region][row['recipe']]
+                    counters[0] += row['ratings']
+                    counters[1] += row['stars']
+                    counters[2] += row['favorites']
+
+            entries = []
+            for region, recipes in scopes.items():
+                for kind, _ in LeaderboardEntry.KIND_CHOICES:
+                    entries.extend(LeaderboardEntry.objects.rank(kind, window, region, recipes, config, now))
+            with transaction.atomic():
+                LeaderboardEntry.objects.filter(window=window).delete()
+                LeaderboardEntry.objects.bulk_create(entries, batch_size=1000)
+            self.stdout.write(f"{window}: {len(entries)} entries across {len(scopes)} scopes")
+        self.stdout.write(self.style.SUCCESS("Leaderboards refreshed."))
+
+    def rebuild_activity(self):
+        buckets = {}
+
+        def bucket(row):
+            key = (row['recipe'], row['user__region'], row['day'])
+            if key not in buckets:
+                buckets[key] = RecipeActivity(recipe_id=key[0], region=key[1], day=key[2])
+            return buckets[key]
+
+        ratings = RecipeRating.objects.annotate(day=TruncDate('created_at')).values('recipe', 'user__region', 'day').annotate(
+            count=Count('id'), stars=Sum('rating'),
+        )
+        for row in ratings.iterator(chunk_size=2000):
+            activity = bucket(row)
+            activity.rating_count, activity.rating_sum = row['count'], row['stars']
+        favorites = FavoriteRecipe.objects.annotate(day=TruncDate('created_at')).values('recipe', 'user__region', 'day').annotate(
+            count=Count('id'),
+        )
+        for row in favorites.iterator(chunk_size=2000):
+            bucket(row).favorite_count = row['count']
+
+        with transaction.atomic():
+            RecipeActivity.objects.all().delete()
+            RecipeActivity.objects.bulk_create(buckets.values(), batch_size=1000)
+        self.stdout.write(f"Rebuilt {len(buckets)} activity buckets.")
@@ -0,0 +1,147 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('recipes', '__first__'), # The real recipes app's history, or the test stand-in
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RatingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('rating', 'Rating'), ('favorite', 'Favorite')], max_length=10)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=10)),
+                ('stars', models.PositiveSmallIntegerField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('recipe', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='recipes.recipe')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Rating Event',
+                'verbose_name_plural': 'Rating Events',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeRatingSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rating_summary', to='recipes.recipe')),
+            ],
+            options={
+                'verbose_name': 'Recipe Rating Summary',
+                'verbose_name_plural': 'Recipe Rating Summaries',
+            },
+        ),
+        migrations.CreateModel(
+            name='FavoriteRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorited_by', to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorite_recipes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Favorite Recipe',
+                'verbose_name_plural': 'Favorite Recipes',
+                'indexes': [models.Index(fields=['user', '-created_at', '-id'], name='favorite_user_created_idx')],
+                'unique_together': {('user', 'recipe')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('top_rated', 'Top rated'), ('most_favorited', 'Most favorited')], max_length=20)),
+                ('window', models.CharField(max_length=10)),
+                ('region', models.CharField(blank=True, max_length=10)),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('average_rating', models.FloatField(null=True)),
+                ('favorite_count', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField()),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to='recipes.recipe')),
+            ],
+            options={
+                'verbose_name': 'Leaderboard Entry',
+                'verbose_name_plural': 'Leaderboard Entries',
+                'ordering': ['rank'],
+                'unique_together': {('kind', 'window', 'region', 'rank')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region', models.CharField(max_length=10)),
+                ('day', models.DateField()),
+                ('rating_count', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('favorite_count', models.IntegerField(default=0)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='recipes.recipe')),
+            ],
+            options={
+                'verbose_name': 'Recipe Activity',
+                'verbose_name_plural': 'Recipe Activity',
+                'indexes': [models.Index(fields=['day'], name='activity_day_idx')],
+                'unique_together': {('recipe', 'region', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeRating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.PositiveSmallIntegerField(choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5')])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='given_ratings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Recipe Rating',
+                'verbose_name_plural': 'Recipe Ratings',
+                'indexes': [models.Index(fields=['recipe', '-created_at', '-id'], name='rating_recipe_created_idx'), models.Index(fields=['user', '-created_at', '-id'], name='rating_user_created_idx')],
+                'unique_together': {('user', 'recipe')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_recipes', to='recipes.recipe')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe')),
+            ],
+            options={
+                'verbose_name': 'Recipe Similarity',
+                'verbose_name_plural': 'Recipe Similarities',
+                'unique_together': {('recipe', 'similar')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rating', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='prior_mean',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,34 +1,658 @@
-from django.db import models
+import heapq
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
+from .caching import invalidate_favorite_ids
+
 # Assuming 'Recipe' model will be provided by Dev 2 in their 'recipes' app
 # You might need to import it like: from recipes.models import Recipe
 
 User = get_user_model()
 
+STAR_VALUES = range(1, 6)
+
+
+def record_rating_changes(user, changes):
+    """
+    Bookkeeping for rating writes besides the rating summaries: the leaderboard activity
+    buckets and boards, and the change log. `changes` holds (recipe_id, rated_at, previous, current).
+    """
+    RecipeActivity.objects.record_ratings(user.region, changes)
+    LeaderboardEntry.objects.record_changes(user.region, {recipe_id for recipe_id, _, previous, current in changes if previous != current})
+    RatingEvent.objects.log_ratings(user, changes)
+
+
+def record_favorite_changes(user, changes):
+    """Same for favorites, plus the cached favorite ID set; `changes` holds (recipe_id, favorited_at, +1 or -1)."""
+    if not changes:
+        return
+    RecipeActivity.objects.record_favorites(user.region, changes)
+    LeaderboardEntry.objects.record_changes(user.region, {recipe_id for recipe_id, _, _ in changes})
+    RatingEvent.objects.log_favorites(user, changes)
+    invalidate_favorite_ids(user.pk)
+
+def insert_new(model, objs, using):
+    """
+    Insert every row of `objs` that doesn't collide with an existing (user, recipe) and
+    return the recipe IDs actually inserted. Uses INSERT ... ON CONFLICT DO NOTHING
+    RETURNING where the backend has it, so the rows a concurrent writer got in first are
+    told apart exactly; elsewhere each row is inserted in its own savepoint.
+    """
+    connection = connections[using]
+    if not (connection.features.can_return_rows_from_bulk_insert and connection.features.supports_update_conflicts_with_target):
+        inserted = set()
+        for obj in objs:
+            try:
+                with transaction.atomic(using=using):
+                    obj.save(force_insert=True, using=using)
+                inserted.add(obj.recipe_id)
+            except IntegrityError:
+                pass
+        return inserted
+
+    opts = model._meta
+    fields = [field for field in opts.concrete_fields if not field.primary_key]
+    quote = connection.ops.quote_name
+    recipe = quote(opts.get_field('recipe').column)
+    sql = 'INSERT INTO {} ({}) VALUES {{}} ON CONFLICT ({}, {}) DO NOTHING RETURNING {}'.format(
+        quote(opts.db_table), ', '.join(quote(field.column) for field in fields),
+        quote(opts.get_field('user').column), recipe, recipe,
+    )
+    row = '({})'.format(', '.join(['%s'] * len(fields)))
+    inserted = set()
+    batch_size = connection.ops.bulk_batch_size(fields, objs)
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            params = [
+                field.get_db_prep_save(field.pre_save(obj, add=True), connection)
+                for obj in batch for field in fields
+            ]
+            cursor.execute(sql.format(', '.join([row] * len(batch))), params)
+            inserted.update(recipe_id for recipe_id, in cursor.fetchall())
+    return inserted
+
+
+class FavoriteRecipeManager(models.Manager):
+    def add(self, user, recipe):
+        """
+        Favorite `recipe` for `user` if they haven't already. Inserts first and falls back to
+        the existing row on a unique violation, so concurrent double-submits can't fail.
+        Returns (favorite, created).
+        """
+        try:
+            with transaction.atomic():
+                favorite = self.create(user=user, recipe=recipe)
+                record_favorite_changes(user, [(favorite.recipe_id, favorite.created_at, 1)])
+                return favorite, True
+        except IntegrityError:
+            favorite = self.filter(user=user, recipe=recipe).first()
+            if favorite is None:
+                raise
+            return favorite, False
+
+    async def aadd(self, user, recipe):
+        # Django has no async transactions: the write and its bookkeeping run in a worker thread
+        return await sync_to_async(self.add)(user, recipe)
+
+    def bulk_add(self, user, recipe_ids):
+        """
+        Favorite every recipe in `recipe_ids` for `user` with one insert and one lookup.
+        Favorites that already exist, including ones added concurrently, are skipped by the
+        insert; only the rows it reports writing are counted. Returns {recipe_id: (favorite, created)}.
+        """
+        with transaction.atomic(using=self.db):
+            inserted = insert_new(self.model, [self.model(user=user, recipe_id=recipe_id) for recipe_id in recipe_ids], self.db)
+            results = {}
+            for favorite in self.filter(user=user, recipe_id__in=recipe_ids):
+                results[favorite.recipe_id] = (favorite, favorite.recipe_id in inserted)
+            record_favorite_changes(user, [
+                (favorite.recipe_id, favorite.created_at, 1) for favorite, created in results.values() if created
+            ])
+        return results
+
 class FavoriteRecipe(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorite_recipes')
     recipe = models.ForeignKey('recipes.Recipe', on_delete=models.CASCADE, related_name='favorited_by')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = FavoriteRecipeManager()
+
     class Meta:
         unique_together = ('user', 'recipe') # A user can favorite a recipe only once
+        indexes = [
+            # Backs the keyset pagination of a user's favorites
+            models.Index(fields=['user', '-created_at', '-id'], name='favorite_user_created_idx'),
+        ]
         verbose_name = "Favorite Recipe"
         verbose_name_plural = "Favorite Recipes"
 
     def _str_(self):
         return f"{self.user.username} favorited {self.recipe.title}"
+
+class RecipeRatingManager(models.Manager):
+    def rate(self, user, recipe, stars):
+        """
+        Rate `recipe` for `user`, or re-rate it if they already have, and update its summary.
+        Inserts first and falls back to updating the locked existing row on a unique violation,
+        so concurrent double-submits can't fail. Returns (rating, created).
+        """
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    rating = self.create(user=user, recipe=recipe, rating=stars)
+                previous = None
+            except IntegrityError:
+                rating = self.select_for_update().filter(user=user, recipe=recipe).first()
+                if rating is None:
+                    raise
+                previous = rating.rating
+                if previous != stars:
+                    rating.rating = stars
+                    rating.save(update_fields=['rating'])
+            RecipeRatingSummary.objects.apply_changes([(rating.recipe_id, previous, stars)])
+            record_rating_changes(user, [(rating.recipe_id, rating.created_at, previous, stars)])
+        return rating, previous is None
+
+    async def arate(self, user, recipe, stars):
+        return await sync_to_async(self.rate)(user, recipe, stars)
+
+    def bulk_rate(self, user, ratings):
+        """
+        Create or update `user`'s ratings from a {recipe_id: stars} mapping in one transaction,
+        using one insert, one locked lookup and one update, and fold the changes into the
+        summaries. Ratings that already exist, including ones created concurrently, are
+        skipped by the insert and updated from their locked value, so the summary deltas
+        start from what is actually stored. Returns {recipe_id: (rating, status)} with status
+        'created', 'updated' or 'unchanged'.
+        """
+        results, changes, activity, to_update = {}, [], [], []
+        with transaction.atomic(using=self.db):
+            inserted = insert_new(
+                self.model, [self.model(user=user, recipe_id=recipe_id, rating=stars) for recipe_id, stars in ratings.items()], self.db,
+            )
+            for rating in self.select_for_update().filter(user=user, recipe_id__in=ratings):
+                stars = ratings[rating.recipe_id]
+                if rating.recipe_id in inserted:
+                    changes.append((rating.recipe_id, None, stars))
+                    activity.append((rating.recipe_id, rating.created_at, None, stars))
+                    results[rating.recipe_id] = (rating, 'created')
+                elif rating.rating != stars:
+                    changes.append((rating.recipe_id, rating.rating, stars))
+                    activity.append((rating.recipe_id, rating.created_at, rating.rating, stars))
+                    rating.rating = stars
+                    to_update.append(rating)
+                    results[rating.recipe_id] = (rating, 'updated')
+                else:
+                    results[rating.recipe_id] = (rating, 'unchanged')
+            self.bulk_update(to_update, ['rating'])
+            RecipeRatingSummary.objects.apply_changes(changes)
+            record_rating_changes(user, activity)
+        return results
+
 class RecipeRating(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='given_ratings')
     recipe = models.ForeignKey('recipes.Recipe', on_delete=models.CASCADE, related_name='ratings')
-    rating = models.PositiveSmallIntegerField(choices=[(i, str(i)) for i in range(1, 6)]) # 1 to 5 stars
+    rating = models.PositiveSmallIntegerField(choices=[(i, str(i)) for i in STAR_VALUES]) # 1 to 5 stars
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = RecipeRatingManager()
+
     class Meta:
         unique_together = ('user', 'recipe') # A user can rate a recipe only once
+        indexes = [
+            # Back the keyset pagination of ratings listed per recipe and per user
+            models.Index(fields=['recipe', '-created_at', '-id'], name='rating_recipe_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='rating_user_created_idx'),
+        ]
         verbose_name = "Recipe Rating"
         verbose_name_plural = "Recipe Ratings"
 
     def _str_(self):
         return f"{self.user.username} rated {self.recipe.title} with {self.rating} stars"
 
+
+class RecipeRatingSummaryManager(models.Manager):
+    def apply_changes(self, changes):
+        """
+        Fold rating changes into the per-recipe summaries.
+
+        `changes` is an iterable of (recipe_id, previous, current) tuples where
+        `previous`/`current` are star values, or None for a created/deleted rating.
+        Runs a constant number of queries however many recipes are touched.
+        """
+        deltas = {}
+        for recipe_id, previous, current in changes:
+            if previous == current:
+                continue
+            delta = deltas.setdefault(recipe_id, {})
+            for stars, sign in ((previous, -1), (current, 1)):
+                if stars is None:
+                    continue
+                for field, amount in (('rating_count', 1), ('rating_sum', stars), (f'stars_{stars}', 1)):
+                    delta[field] = delta.get(field, 0) + sign * amount
+        # An update that moves a rating back and forth can cancel out entirely
+        deltas = {recipe_id: delta for recipe_id, delta in deltas.items() if any(delta.values())}
+        if not deltas:
+            return
+
+        with transaction.atomic():
+            # Make sure every touched recipe has a row (this also takes the write lock on SQLite
+            # before we read), then lock the rows and adjust the counters in a single UPDATE.
+            self.bulk_create([self.model(recipe_id=recipe_id) for recipe_id in deltas], ignore_conflicts=True)
+            summaries = list(self.select_for_update().filter(recipe_id__in=deltas))
+            now = timezone.now()
+            fields = {'updated_at'}
+            for summary in summaries:
+                for field, amount in deltas[summary.recipe_id].items():
+                    setattr(summary, field, getattr(summary, field) + amount)
+                    fields.add(field)
+                summary.updated_at = now
+            self.bulk_update(summaries, sorted(fields))
+
+
+class RecipeRatingSummary(models.Model):
+    """Denormalized rating totals for a recipe, kept in sync on every rating write."""
+    recipe = models.OneToOneField('recipes.Recipe', on_delete=models.CASCADE, related_name='rating_summary')
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RecipeRatingSummaryManager()
+
+    class Meta:
+        verbose_name = "Recipe Rating Summary"
+        verbose_name_plural = "Recipe Rating Summaries"
+
+    def __str__(self):
+        return f"Rating summary for recipe {self.recipe_id}"
+
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @property
+    def histogram(self):
+        return {str(stars): getattr(self, f'stars_{stars}') for stars in STAR_VALUES}
+
+
+class RecipeActivityManager(models.Manager):
+    def record_ratings(self, region, changes):
+        """
+        Fold rating changes made by a user from `region` into the daily activity buckets.
+
+        `changes` holds (recipe_id, rated_at, previous, current) tuples: the same star values
+        as RecipeRatingSummary.objects.apply_changes, plus when the rating was first made,
+        which decides the day it counts towards.
+        """
+        deltas = {}
+        for recipe_id, rated_at, previous, current in changes:
+            if previous == current:
+                continue
+            delta = deltas.setdefault((recipe_id, region, timezone.localdate(rated_at)), {})
+            for stars, sign in ((previous, -1), (current, 1)):
+                if stars is None:
+                    continue
+                delta['rating_count'] = delta.get('rating_count', 0) + sign
+                delta['rating_sum'] = delta.get('rating_sum', 0) + sign * stars
+        self.apply_deltas(deltas)
+
+    def record_favorites(self, region, changes):
+        """`changes` holds (recipe_id, favorited_at, +1 or -1) tuples for favorites added/removed."""
+        deltas = {}
+        for recipe_id, favorited_at, amount in changes:
+            delta = deltas.setdefault((recipe_id, region, timezone.localdate(favorited_at)), {'favorite_count': 0})
+            delta['favorite_count'] += amount
+        self.apply_deltas(deltas)
+
+    def apply_deltas(self, deltas):
+        """
+        Add {(recipe_id, region, day): {field: amount}} to the buckets. A single bucket (one
+        rating or favorite) is bumped with one UPDATE when it already exists; batches run a
+        constant number of queries, the same way RecipeRatingSummary.objects.apply_changes does.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if any(delta.values())}
+        if not deltas:
+            return
+
+        if len(deltas) == 1:
+            [((recipe_id, region, day), delta)] = deltas.items()
+            bucket = self.filter(recipe_id=recipe_id, region=region, day=day)
+            increments = {field: models.F(field) + amount for field, amount in delta.items()}
+            if bucket.update(**increments):
+                return
+            try:
+                with transaction.atomic():
+                    self.create(recipe_id=recipe_id, region=region, day=day, **delta)
+                    return
+            except IntegrityError:
+                # Created concurrently since our UPDATE; it exists now
+                bucket.update(**increments)
+                return
+
+        with transaction.atomic():
+            self.bulk_create(
+                [self.model(recipe_id=recipe_id, region=region, day=day) for recipe_id, region, day in deltas],
+                ignore_conflicts=True,
+            )
+            candidates = self.select_for_update().filter(
+                recipe_id__in={key[0] for key in deltas},
+                region__in={key[1] for key in deltas},
+                day__in={key[2] for key in deltas},
+            )
+            buckets = [bucket for bucket in candidates if (bucket.recipe_id, bucket.region, bucket.day) in deltas]
+            fields = set()
+            for bucket in buckets:
+                for field, amount in deltas[bucket.recipe_id, bucket.region, bucket.day].items():
+                    setattr(bucket, field, getattr(bucket, field) + amount)
+                    fields.add(field)
+            self.bulk_update(buckets, sorted(fields))
+
+
+class RecipeActivity(models.Model):
+    """
+    Ratings and favorites a recipe received per day from users of one region, kept in sync on
+    every write. The leaderboards are computed from these buckets instead of the raw tables.
+    Counters are signed: activity is attributed to the user's region at write time, so a user
+    moving region can leave a bucket off until `refresh_leaderboards --rebuild-activity`.
+    """
+    recipe = models.ForeignKey('recipes.Recipe', on_delete=models.CASCADE, related_name='activity')
+    region = models.CharField(max_length=10)
+    day = models.DateField()
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    favorite_count = models.IntegerField(default=0)
+
+    objects = RecipeActivityManager()
+
+    class Meta:
+        unique_together = ('recipe', 'region', 'day')
+        indexes = [
+            # Backs the windowed scans of refresh_leaderboards
+            models.Index(fields=['day'], name='activity_day_idx'),
+        ]
+        verbose_name = "Recipe Activity"
+        verbose_name_plural = "Recipe Activity"
+
+    def __str__(self):
+        return f"Activity for recipe {self.recipe_id} in {self.region} on {self.day}"
+
+
+class LeaderboardEntryManager(models.Manager):
+    def rank(self, kind, window, region, totals, config, now, mean=None):
+        """
+        The (kind, window, region) board as unsaved entries, best first: at most SIZE of the
+        recipes in `totals`, {recipe_id: (ratings, stars, favorites)}. Top-rated scores are
+        Bayesian averages, every recipe starting from `mean` (that of `totals` by default)
+        with PRIOR_WEIGHT votes.
+        """
+        if kind == self.model.TOP_RATED:
+            rated = {recipe_id: counters for recipe_id, counters in totals.items() if counters[0] > 0}
+            if not rated:
+                return []
+            prior = config['PRIOR_WEIGHT']
+            if mean is None:
+                mean = sum(counters[1] for counters in rated.values()) / sum(counters[0] for counters in rated.values())
+            scored = (
+                ((prior * mean + stars) / (prior + ratings), recipe_id, ratings, stars, favorites)
+                for recipe_id, (ratings, stars, favorites) in rated.items()
+            )
+            best = heapq.nsmallest(config['SIZE'], scored, key=lambda item: (-item[0], item[1]))
+            return [
+                self.model(
+                    kind=kind, window=window, region=region, rank=rank, recipe_id=recipe_id,
+                    score=round(score, 4), rating_count=ratings, rating_sum=stars, average_rating=round(stars / ratings, 2),
+                    favorite_count=max(favorites, 0), prior_mean=mean, computed_at=now,
+                )
+                for rank, (score, recipe_id, ratings, stars, favorites) in enumerate(best, start=1)
+            ]
+
+        favorited = ((counters[2], recipe_id, counters) for recipe_id, counters in totals.items() if counters[2] > 0)
+        best = heapq.nsmallest(config['SIZE'], favorited, key=lambda item: (-item[0], item[1]))
+        return [
+            self.model(
+                kind=kind, window=window, region=region, rank=rank, recipe_id=recipe_id,
+                score=favorites, rating_count=max(ratings, 0), rating_sum=max(stars, 0) if ratings > 0 else 0,
+                average_rating=round(stars / ratings, 2) if ratings > 0 else None,
+                favorite_count=favorites, computed_at=now,
+            )
+            for rank, (favorites, recipe_id, (ratings, stars, _)) in enumerate(best, start=1)
+        ]
+
+    def record_changes(self, region, recipe_ids):
+        """
+        Re-rank `recipe_ids` on every board of `region` and of all regions after a write.
+
+        Only the touched recipes' activity buckets are read, and each affected board (at
+        most SIZE rows) is patched in place, so the cost doesn't grow with the tables. Scores
+        keep the board mean of the last refresh, and a touched recipe that fell keeps its
+        place even if a recipe outside the board now outranks it; `refresh_leaderboards`
+        expires old activity out of the windows and repairs both.
+        """
+        if not recipe_ids:
+            return
+        config = settings.LEADERBOARD
+        now = timezone.now()
+        windows = list(config['WINDOWS'].items())
+        scopes = {region, ''}
+
+        # {(window, scope): {recipe_id: [ratings, stars, favorites]}} for the touched recipes
+        fresh = {(window, scope): {recipe_id: [0, 0, 0] for recipe_id in recipe_ids} for window, _ in windows for scope in scopes}
+        annotations = {}
+        for index, (window, days) in enumerate(windows):
+            recent = None if days is None else Q(day__gt=timezone.localdate(now) - timedelta(days=days))
+            for field in ACTIVITY_FIELDS:
+                annotations[f'{field}_{index}'] = Sum(field, filter=recent)
+        buckets = RecipeActivity.objects.filter(recipe_id__in=recipe_ids).values('recipe', 'region').annotate(**annotations)
+        for row in buckets:
+            for index, (window, _) in enumerate(windows):
+                for scope in {row['region'], ''} & scopes:
+                    counters = fresh[window, scope][row['recipe']]
+                    for position, field in enumerate(ACTIVITY_FIELDS):
+                        counters[position] += row[f'{field}_{index}'] or 0
+
+        boards = {}
+        for entry in self.filter(window__in=[window for window, _ in windows], region__in=scopes):
+            boards.setdefault((entry.kind, entry.window, entry.region), []).append(entry)
+        stale, entries = [], []
+        for kind, _ in self.model.KIND_CHOICES:
+            for window, _ in windows:
+                for scope in scopes:
+                    current = sorted(boards.get((kind, window, scope), ()), key=lambda entry: entry.rank)
+                    totals = {entry.recipe_id: (entry.rating_count, entry.rating_sum, entry.favorite_count) for entry in current}
+                    totals.update(fresh[window, scope])
+                    mean = current[0].prior_mean if current else None
+                    ranked = self.rank(kind, window, scope, totals, config, now, mean)
+                    # Rewrite only the ranks whose row changed
+                    by_rank = {entry.rank: entry for entry in current}
+                    for entry in ranked:
+                        previous = by_rank.pop(entry.rank, None)
+                        if previous is None or _board_row(previous) != _board_row(entry):
+                            if previous is not None:
+                                stale.append(previous)
+                            entries.append(entry)
+                    stale.extend(by_rank.values()) # Ranks the board no longer fills
+        if not entries and not stale:
+            return
+        try:
+            with transaction.atomic():
+                self.filter(pk__in=[entry.pk for entry in stale]).delete()
+                self.bulk_create(entries)
+        except IntegrityError:
+            # A concurrent write re-ranked the same board first; the boards are derived data,
+            # so the next write or refresh catches up rather than this write failing
+            pass
+
+
+ACTIVITY_FIELDS = ('rating_count', 'rating_sum', 'favorite_count')
+
+
+def _board_row(entry):
+    return (entry.recipe_id, entry.score, entry.rating_count, entry.rating_sum, entry.favorite_count)
+
+
+class LeaderboardEntry(models.Model):
+    """
+    One ranked row of a precomputed leaderboard, patched on every rating and favorite write
+    and rebuilt by `manage.py refresh_leaderboards`. A board is identified by (kind, window,
+    region); region '' is the board across all regions.
+    """
+    TOP_RATED = 'top_rated'
+    MOST_FAVORITED = 'most_favorited'
+    KIND_CHOICES = [
+        (TOP_RATED, 'Top rated'),
+        (MOST_FAVORITED, 'Most favorited'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    window = models.CharField(max_length=10) # A key of settings.LEADERBOARD['WINDOWS']
+    region = models.CharField(max_length=10, blank=True)
+    rank = models.PositiveIntegerField()
+    recipe = models.ForeignKey('recipes.Recipe', on_delete=models.CASCADE, related_name='leaderboard_entries')
+    score = models.FloatField()
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(null=True)
+    favorite_count = models.PositiveIntegerField(default=0)
+    prior_mean = models.FloatField(null=True) # The board's mean rating its top-rated scores start from
+    computed_at = models.DateTimeField()
+
+    objects = LeaderboardEntryManager()
+
+    class Meta:
+        unique_together = ('kind', 'window', 'region', 'rank') # Also serves the top-N read
+        ordering = ['rank']
+        verbose_name = "Leaderboard Entry"
+        verbose_name_plural = "Leaderboard Entries"
+
+    def __str__(self):
+        return f"#{self.rank} {self.kind} {self.window} {self.region or 'all regions'}: recipe {self.recipe_id}"
+
+
+class RecipeSimilarityManager(models.Manager):
+    def recommend(self, user, limit, config):
+        """
+        Personalized recommendations for `user` as [(recipe_id, score)], best first.
+
+        Scores the stored neighbors of the user's most recent ratings and favorites (up to
+        config['SEED_ITEMS'] of each): every neighbor earns similarity x seed weight, where a
+        rating weighs (stars - 3) / 2, so recipes like the ones the user disliked sink, and a
+        favorite config['FAVORITE_WEIGHT']. Recipes the user already rated or favorited are
+        excluded in the same query.
+        """
+        seeds = {}
+        recent_ratings = RecipeRating.objects.filter(user=user).order_by('-created_at', '-id')
+        for recipe_id, stars in recent_ratings.values_list('recipe_id', 'rating')[:config['SEED_ITEMS']]:
+            seeds[recipe_id] = (stars - 3) / 2
+        recent_favorites = FavoriteRecipe.objects.filter(user=user).order_by('-created_at', '-id')
+        for recipe_id in recent_favorites.values_list('recipe_id', flat=True)[:config['SEED_ITEMS']]:
+            seeds[recipe_id] = seeds.get(recipe_id, 0) + config['FAVORITE_WEIGHT']
+        if not seeds:
+            return []
+
+        neighbors = self.filter(recipe_id__in=seeds).exclude(
+            similar__in=RecipeRating.objects.filter(user=user).values('recipe_id'),
+        ).exclude(
+            similar__in=FavoriteRecipe.objects.filter(user=user).values('recipe_id'),
+        )
+        scores = {}
+        for recipe_id, similar_id, similarity in neighbors.values_list('recipe_id', 'similar_id', 'score'):
+            scores[similar_id] = scores.get(similar_id, 0) + similarity * seeds[recipe_id]
+        ranked = sorted(((score, recipe_id) for recipe_id, score in scores.items() if score > 0), key=lambda item: (-item[0], item[1]))
+        return [(recipe_id, score) for score, recipe_id in ranked[:limit]]
+
+
+class RecipeSimilarity(models.Model):
+    """
+    One of the most similar recipes to `recipe` by who rated and favorited both (item-item
+    cosine similarity), precomputed by `manage.py build_recommendations`.
+    """
+    recipe = models.ForeignKey('recipes.Recipe', on_delete=models.CASCADE, related_name='similar_recipes')
+    similar = models.ForeignKey('recipes.Recipe', on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    objects = RecipeSimilarityManager()
+
+    class Meta:
+        unique_together = ('recipe', 'similar') # Also serves the neighbor lookup by recipe
+        verbose_name = "Recipe Similarity"
+        verbose_name_plural = "Recipe Similarities"
+
+    def __str__(self):
+        return f"Recipe {self.similar_id} is similar to {self.recipe_id} ({self.score:.2f})"
+
+
+class RatingEventManager(models.Manager):
+    def log_ratings(self, user, changes):
+        """Append one event per rating change: (recipe_id, rated_at, previous, current) tuples."""
+        events = []
+        for recipe_id, _, previous, current in changes:
+            if previous == current:
+                continue
+            action = self.model.CREATED if previous is None else self.model.DELETED if current is None else self.model.UPDATED
+            events.append(self.model(kind=self.model.RATING, action=action, user_id=user.pk, recipe_id=recipe_id, stars=current))
+        self.bulk_create(events)
+
+    def log_favorites(self, user, changes):
+        """Append one event per favorite added (+1) or removed (-1)."""
+        self.bulk_create([
+            self.model(
+                kind=self.model.FAVORITE, action=self.model.CREATED if amount > 0 else self.model.DELETED,
+                user_id=user.pk, recipe_id=recipe_id,
+            )
+            for recipe_id, _, amount in changes
+        ])
+
+
+class RatingEvent(models.Model):
+    """
+    Append-only log of rating and favorite writes, consumed in id order by incremental jobs
+    such as `build_recommendations --incremental`. Rows outlive the users and recipes they
+    mention, so the references are unconstrained.
+    """
+    RATING = 'rating'
+    FAVORITE = 'favorite'
+    KIND_CHOICES = [(RATING, 'Rating'), (FAVORITE, 'Favorite')]
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTION_CHOICES = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    recipe = models.ForeignKey('recipes.Recipe', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    stars = models.PositiveSmallIntegerField(null=True) # The new rating; None for favorites and deletions
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = RatingEventManager()
+
+    class Meta:
+        verbose_name = "Rating Event"
+        verbose_name_plural = "Rating Events"
+
+    def __str__(self):
+        return f"{self.kind} {self.action} by user {self.user_id} on recipe {self.recipe_id}"
+
+
+class ChangeLogCheckpoint(models.Model):
+    """How far (RatingEvent id) the consumer called `name` has processed the change log."""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at event {self.last_event_id}"
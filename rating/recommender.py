@@ -0,0 +1,115 @@
+# rating/recommender.py
+#
+# Offline item-item collaborative filtering over RecipeRating and FavoriteRecipe, run by
+# `manage.py build_recommendations`. Needs numpy and scipy, which the web workers don't:
+# only the command imports this module.
+
+from array import array
+
+from django.db.models import Count, Exists, F, OuterRef, Sum
+import numpy as np
+from scipy import sparse
+
+from .models import FavoriteRecipe, RecipeRating
+
+# Dense similarity cells computed per block (float32), bounding memory to ~64MB per block
+BLOCK_CELLS = 2 ** 24
+
+
+def load_interactions(favorite_weight, users=None):
+    """
+    Every rating and favorite, or only those of `users` (a queryset of user ids), as parallel
+    (user_ids, recipe_ids, weights) arrays. A rating weighs stars / 5 and a favorite
+    `favorite_weight`; both for the same pair add up.
+    """
+    ratings, favorites = RecipeRating.objects.all(), FavoriteRecipe.objects.all()
+    if users is not None:
+        ratings, favorites = ratings.filter(user_id__in=users), favorites.filter(user_id__in=users)
+    user_ids, recipe_ids, weights = array('q'), array('q'), array('d')
+    for user_id, recipe_id, stars in ratings.values_list('user_id', 'recipe_id', 'rating').iterator(chunk_size=10000):
+        user_ids.append(user_id)
+        recipe_ids.append(recipe_id)
+        weights.append(stars / 5)
+    for user_id, recipe_id in favorites.values_list('user_id', 'recipe_id').iterator(chunk_size=10000):
+        user_ids.append(user_id)
+        recipe_ids.append(recipe_id)
+        weights.append(favorite_weight)
+    return (
+        np.frombuffer(user_ids, dtype=np.int64),
+        np.frombuffer(recipe_ids, dtype=np.int64),
+        np.frombuffer(weights, dtype=np.float64),
+    )
+
+
+def column_norms(recipe_ids, favorite_weight):
+    """
+    The norm every recipe's column has in the full matrix, from three grouped queries over
+    those recipes only: (stars/5 + favorite)^2 summed per user = stars^2/25 + 2 * favorite
+    * stars/5 for users who also favorited it + favorite^2 per favorite.
+    """
+    squares = dict.fromkeys(recipe_ids.tolist(), 0.0)
+    ratings = RecipeRating.objects.filter(recipe_id__in=squares)
+    for recipe_id, total in ratings.values('recipe_id').annotate(total=Sum(F('rating') * F('rating'))).values_list('recipe_id', 'total'):
+        squares[recipe_id] += total / 25
+    also_favorited = ratings.filter(Exists(FavoriteRecipe.objects.filter(user_id=OuterRef('user_id'), recipe_id=OuterRef('recipe_id'))))
+    for recipe_id, total in also_favorited.values('recipe_id').annotate(total=Sum('rating')).values_list('recipe_id', 'total'):
+        squares[recipe_id] += 2 * favorite_weight * total / 5
+    favorites = FavoriteRecipe.objects.filter(recipe_id__in=squares)
+    for recipe_id, count in favorites.values('recipe_id').annotate(count=Count('id')).values_list('recipe_id', 'count'):
+        squares[recipe_id] += favorite_weight ** 2 * count
+    return np.sqrt(np.array([squares[recipe_id] for recipe_id in recipe_ids.tolist()], dtype=np.float64))
+
+
+def build_matrix(user_ids, recipe_ids, weights):
+    """Sparse users x recipes matrix; returns (recipe id of each column, matrix)."""
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    recipes, recipe_index = np.unique(recipe_ids, return_inverse=True)
+    # Duplicate (user, recipe) entries, i.e. rated and favorited, are summed
+    matrix = sparse.csr_matrix((weights, (user_index, recipe_index)), shape=(len(users), len(recipes)), dtype=np.float32)
+    return recipes, matrix
+
+
+def similarity_blocks(matrix, columns, norms=None):
+    """
+    Cosine similarity of each column in `columns` against every column, as dense
+    (n_recipes x block) arrays, yielded with the block of columns they belong to. `norms`
+    overrides the column norms when `matrix` holds only some users' rows.
+    """
+    n_recipes = matrix.shape[1]
+    columns = np.asarray(columns, dtype=np.int64)
+    if norms is None:
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    norms = np.where(norms == 0, 1, norms)
+    normalized = (matrix @ sparse.diags(1 / norms)).tocsc()
+    transposed = normalized.T.tocsr()
+
+    block_size = max(1, BLOCK_CELLS // n_recipes)
+    for start in range(0, len(columns), block_size):
+        block = columns[start:start + block_size]
+        similarities = (transposed @ normalized[:, block]).toarray()
+        similarities[block, np.arange(len(block))] = 0 # A recipe isn't its own neighbor
+        yield block, similarities
+
+
+def top_neighbors(matrix, neighbors, columns=None, min_similarity=0.0, norms=None):
+    """
+    Cosine similarity between recipe columns, keeping the `neighbors` most similar recipes
+    of each column in `columns` (default: all). Yields (column, neighbor_columns, scores)
+    sorted by descending score. Columns are processed in blocks: one sparse product and
+    one partial sort per block, never the full recipes x recipes matrix.
+    """
+    n_recipes = matrix.shape[1]
+    columns = np.arange(n_recipes) if columns is None else np.asarray(columns)
+    k = min(neighbors, n_recipes - 1)
+    if k <= 0 or not len(columns):
+        return
+
+    for block, similarities in similarity_blocks(matrix, columns, norms):
+        top = np.argpartition(-similarities, k - 1, axis=0)[:k]
+        scores = np.take_along_axis(similarities, top, axis=0)
+        order = np.argsort(-scores, axis=0, kind='stable')
+        top = np.take_along_axis(top, order, axis=0)
+        scores = np.take_along_axis(scores, order, axis=0)
+        for offset, column in enumerate(block):
+            keep = scores[:, offset] > min_similarity
+            yield column, top[keep, offset], scores[keep, offset]
@@ -1,12 +1,31 @@
 from rest_framework import serializers
-from .models import FavoriteRecipe, RecipeRating
+from .models import FavoriteRecipe, LeaderboardEntry, RecipeRating, RecipeRatingSummary
 
 # Assuming 'RecipeSerializer' will be provided by Dev 2
 # from recipes.serializers import RecipeSerializer
 
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves the related object from `context['prefetched'][field_name]` when the caller has
+    already loaded them in bulk (see the bulk views), instead of issuing one query per item.
+    """
+    def to_internal_value(self, data):
+        prefetched = self.context.get('prefetched', {}).get(self.field_name)
+        if prefetched is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return prefetched[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
 class FavoriteRecipeSerializer(serializers.ModelSerializer):
     # This assumes RecipeSerializer will include relevant recipe details
     # recipe = RecipeSerializer(read_only=True) # Uncomment if you want nested recipe data on GET
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
 
     class Meta:
         model = FavoriteRecipe
@@ -14,7 +33,28 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'created_at'] # User and creation date are set automatically
 
 class RecipeRatingSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = RecipeRating
         fields = ['id', 'user', 'recipe', 'rating', 'created_at']
         read_only_fields = ['user', 'created_at'] # User and creation date are set automatically
+
+class RecipeRatingSummarySerializer(serializers.ModelSerializer):
+    average_rating = serializers.SerializerMethodField()
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = RecipeRatingSummary
+        fields = ['recipe', 'rating_count', 'average_rating', 'histogram']
+        read_only_fields = fields
+
+    def get_average_rating(self, obj):
+        average = obj.average_rating
+        return round(average, 2) if average is not None else None
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LeaderboardEntry
+        fields = ['rank', 'recipe', 'score', 'rating_count', 'average_rating', 'favorite_count']
+        read_only_fields = fields
@@ -1,3 +1,503 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound
+from rest_framework.test import APIClient
+
+from meal_project.db_router import PRIMARY, PrimaryReplicaRouter, ReplicaRoutingMiddleware
+from meal_project.testing import SHARED_TEST_CACHES, SHARED_TOKEN_AUTH_CACHE, QueryBudgetMixin
+from users.authentication import invalidate_user_tokens
+
+from .models import (
+    ChangeLogCheckpoint,
+    FavoriteRecipe,
+    LeaderboardEntry,
+    RatingEvent,
+    RecipeActivity,
+    RecipeRating,
+    RecipeRatingSummary,
+    RecipeSimilarity,
+)
+from .serializers import RecipeRatingSerializer
+from .views import BulkWriteView, delete_favorite, delete_rating, save_rating_update
+
+User = get_user_model()
+Recipe = RecipeRating._meta.get_field('recipe').related_model
+
+RECIPES = 200
+RATERS = 40
+RATINGS_PER_RATER = 50
+FAVORITES_PER_USER = 30
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    RATING_PAGE_SIZE=50,
+    RATING_MAX_PAGE_SIZE=200,
+    CACHES=SHARED_TEST_CACHES,
+    TOKEN_AUTH_CACHE=SHARED_TOKEN_AUTH_CACHE,
+)
+class RatingQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every route in rating/urls.py, against a few thousand ratings and favorites."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = Recipe.objects.bulk_create([Recipe(title=f'Recipe {i}') for i in range(RECIPES)])
+        cls.raters = User.objects.bulk_create([
+            User(username=f'rater{i}', email=f'rater{i}@example.com', region=('cm', 'ng')[i % 2]) for i in range(RATERS)
+        ])
+        for offset, rater in enumerate(cls.raters):
+            rated = [cls.recipes[(offset + i) % RECIPES] for i in range(RATINGS_PER_RATER)]
+            RecipeRating.objects.bulk_rate(rater, {recipe.pk: (offset + recipe.pk) % 5 + 1 for recipe in rated})
+            FavoriteRecipe.objects.bulk_add(rater, [recipe.pk for recipe in rated[:FAVORITES_PER_USER]])
+        cls.user = cls.raters[0]
+        cls.token = Token.objects.create(user=cls.user)
+        cls.own_rating = RecipeRating.objects.filter(user=cls.user).first()
+        cls.own_favorite = FavoriteRecipe.objects.filter(user=cls.user).first()
+        cls.unrated = [recipe for recipe in cls.recipes if not RecipeRating.objects.filter(user=cls.user, recipe=recipe).exists()]
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_list_favorites(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('favorite-recipes-list-create'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), FAVORITES_PER_USER)
+        self.assertMaxResponseSize(response, 4 * 1024)
+
+    def test_create_favorite(self):
+        with self.assertMaxQueries(13):
+            response = self.client.post(reverse('favorite-recipes-list-create'), {'recipe': self.unrated[0].pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_create_existing_favorite(self):
+        with self.assertMaxQueries(7):
+            response = self.client.post(reverse('favorite-recipes-list-create'), {'recipe': self.own_favorite.recipe_id}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_destroy_favorite(self):
+        with self.assertMaxQueries(13):
+            response = self.client.delete(reverse('favorite-recipe-destroy', args=[self.own_favorite.pk]))
+        self.assertEqual(response.status_code, 204)
+
+    def test_bulk_favorites(self):
+        items = [{'recipe': recipe.pk} for recipe in self.recipes[:150]]
+        with self.assertMaxQueries(29):
+            response = self.client.post(reverse('favorite-recipes-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 150)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses.count('exists'), FAVORITES_PER_USER)
+        # Replaying the batch writes nothing and logs nothing
+        events = RatingEvent.objects.count()
+        response = self.client.post(reverse('favorite-recipes-bulk'), items, format='json')
+        self.assertEqual({result['status'] for result in response.data['results']}, {'exists'})
+        self.assertEqual(RatingEvent.objects.count(), events)
+
+    def test_incomplete_bulk_view_is_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            class NoWriteView(BulkWriteView):
+                serializer_class = RecipeRatingSerializer
+
+    def test_list_own_ratings(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('recipe-ratings-list-create'))
+        self.assertEqual(len(response.data['results']), RATINGS_PER_RATER)
+        self.assertMaxResponseSize(response, 6 * 1024)
+
+    def test_list_recipe_ratings_is_paginated(self):
+        recipe = self.recipes[RATERS]  # Rated by every rater
+        url = reverse('recipe-ratings-list-create')
+        with self.assertMaxQueries(2):
+            response = self.client.get(url, {'recipe_id': recipe.pk, 'page_size': 10})
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNotNone(response.data['next'])
+        self.assertMaxResponseSize(response, 2 * 1024)
+        # Later pages are one query, like the first one once the token is cached
+        with self.assertMaxQueries(1):
+            response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_create_rating(self):
+        with self.assertMaxQueries(21):
+            response = self.client.post(reverse('recipe-ratings-list-create'), {'recipe': self.unrated[0].pk, 'rating': 4}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_rerate(self):
+        with self.assertMaxQueries(27):
+            response = self.client.post(
+                reverse('recipe-ratings-list-create'),
+                {'recipe': self.own_rating.recipe_id, 'rating': self.own_rating.rating % 5 + 1},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_ratings(self):
+        items = [{'recipe': recipe.pk, 'rating': 5} for recipe in self.recipes[:150]]
+        with self.assertMaxQueries(37):
+            response = self.client.post(reverse('recipe-ratings-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 150)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses.count('created'), 150 - RATINGS_PER_RATER)
+        # Already rated recipes were updated in place, not counted again
+        for recipe in self.recipes[:150:25]:
+            summary = RecipeRatingSummary.objects.get(recipe=recipe)
+            ratings = RecipeRating.objects.filter(recipe=recipe)
+            self.assertEqual(summary.rating_count, ratings.count())
+            self.assertEqual(summary.rating_sum, sum(ratings.values_list('rating', flat=True)))
+
+    def test_retrieve_rating(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('recipe-rating-detail', args=[self.own_rating.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_rating(self):
+        with self.assertMaxQueries(23):
+            response = self.client.patch(
+                reverse('recipe-rating-detail', args=[self.own_rating.pk]),
+                {'rating': self.own_rating.rating % 5 + 1},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_destroy_rating(self):
+        with self.assertMaxQueries(19):
+            response = self.client.delete(reverse('recipe-rating-detail', args=[self.own_rating.pk]))
+        self.assertEqual(response.status_code, 204)
+
+    def test_overlapping_rating_writes(self):
+        # Each request works from the copy it loaded before the other one wrote
+        recipe = self.own_rating.recipe
+        first, second = RecipeRating.objects.get(pk=self.own_rating.pk), RecipeRating.objects.get(pk=self.own_rating.pk)
+        for copy, stars in ((first, first.rating % 5 + 1), (second, (first.rating + 1) % 5 + 1)):
+            serializer = RecipeRatingSerializer(copy, data={'rating': stars}, partial=True)
+            serializer.is_valid(raise_exception=True)
+            save_rating_update(self.user, serializer)
+        summary = RecipeRatingSummary.objects.get(recipe=recipe)
+        self.assertEqual(summary.rating_count, RecipeRating.objects.filter(recipe=recipe).count())
+        self.assertEqual(summary.rating_sum, sum(RecipeRating.objects.filter(recipe=recipe).values_list('rating', flat=True)))
+
+        delete_rating(self.user, first)
+        with self.assertRaises(NotFound):
+            delete_rating(self.user, second)
+        summary.refresh_from_db()
+        self.assertEqual(summary.rating_count, RecipeRating.objects.filter(recipe=recipe).count())
+        self.assertEqual(RatingEvent.objects.filter(recipe=recipe, user=self.user, action=RatingEvent.DELETED).count(), 1)
+
+    def test_overlapping_unfavorites(self):
+        recipe_id = self.own_favorite.recipe_id
+        copies = [FavoriteRecipe.objects.get(pk=self.own_favorite.pk) for _ in range(2)]
+        delete_favorite(self.user, copies[0])
+        with self.assertRaises(NotFound):
+            delete_favorite(self.user, copies[1])
+        self.assertFalse(RecipeActivity.objects.filter(recipe_id=recipe_id, favorite_count__lt=0).exists())
+        self.assertEqual(RatingEvent.objects.filter(recipe_id=recipe_id, user=self.user, kind=RatingEvent.FAVORITE, action=RatingEvent.DELETED).count(), 1)
+
+    def test_bulk_writes_without_returning(self):
+        # Backends without INSERT ... ON CONFLICT ... RETURNING insert row by row instead
+        recipe_ids = [self.own_favorite.recipe_id, self.unrated[0].pk]
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            favorites = FavoriteRecipe.objects.bulk_add(self.user, recipe_ids)
+            ratings = RecipeRating.objects.bulk_rate(self.user, {self.own_rating.recipe_id: self.own_rating.rating, self.unrated[0].pk: 3})
+        self.assertEqual({recipe_id: created for recipe_id, (_, created) in favorites.items()}, dict(zip(recipe_ids, [False, True])))
+        self.assertEqual(
+            {recipe_id: status for recipe_id, (_, status) in ratings.items()},
+            {self.own_rating.recipe_id: 'unchanged', self.unrated[0].pk: 'created'},
+        )
+        self.assertEqual(RecipeRatingSummary.objects.get(recipe=self.unrated[0]).rating_count, RecipeRating.objects.filter(recipe=self.unrated[0]).count())
+
+    def test_async_reads_match_sync(self):
+        recipe = self.recipes[RATERS]
+        for name, args, params in [
+            ('favorite-recipes-list-create', [], {}),
+            ('recipe-ratings-list-create', [], {}),
+            ('recipe-ratings-list-create', [], {'recipe_id': recipe.pk, 'page_size': 10}),
+            ('recipe-rating-detail', [self.own_rating.pk], {}),
+        ]:
+            # The sync request has cached the token, so only the read itself is left
+            expected = self.client.get(reverse(name, args=args), params).json()
+            with self.assertMaxQueries(1):
+                response = self.client.get(reverse(f'async-{name}', args=args), params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            if 'results' in expected:
+                self.assertEqual(data['results'], expected['results'])
+                self.assertEqual(data['next'] is None, expected['next'] is None)
+            else:
+                self.assertEqual(data, expected)
+
+        # Cursor links point back at the async route
+        response = self.client.get(self.client.get(reverse('async-recipe-ratings-list-create'), {'recipe_id': recipe.pk, 'page_size': 10}).json()['next'])
+        self.assertEqual(len(response.json()['results']), 10)
+
+        with self.assertMaxQueries(0):
+            response = self.client_class().get(reverse('async-favorite-recipes-list-create'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_async_writes(self):
+        with self.assertMaxQueries(13):
+            response = self.client.post(reverse('async-favorite-recipes-list-create'), {'recipe': self.unrated[0].pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        with self.assertMaxQueries(12):
+            response = self.client.delete(reverse('async-favorite-recipe-destroy', args=[response.json()['id']]))
+        self.assertEqual(response.status_code, 204)
+
+        with self.assertMaxQueries(20):
+            response = self.client.post(reverse('async-recipe-ratings-list-create'), {'recipe': self.unrated[0].pk, 'rating': 4}, format='json')
+        self.assertEqual(response.status_code, 201)
+        rating_id = response.json()['id']
+        with self.assertMaxQueries(20):
+            response = self.client.patch(reverse('async-recipe-rating-detail', args=[rating_id]), {'rating': 2}, format='json')
+        self.assertEqual(response.json()['rating'], 2)
+        with self.assertMaxQueries(19):
+            response = self.client.delete(reverse('async-recipe-rating-detail', args=[rating_id]))
+        self.assertEqual(response.status_code, 204)
+        # The summaries went through the same bookkeeping as the sync views
+        summary = RecipeRatingSummary.objects.get(recipe=self.unrated[0])
+        self.assertEqual(summary.rating_count, RecipeRating.objects.filter(recipe=self.unrated[0]).count())
+
+        response = self.client.post(reverse('async-recipe-ratings-list-create'), {'recipe': self.unrated[0].pk, 'rating': 9}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('rating', response.json())
+
+    def test_rating_summary(self):
+        recipe = self.recipes[RATERS]
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('recipe-rating-summary', args=[recipe.pk]))
+        self.assertEqual(response.data['rating_count'], RecipeRating.objects.filter(recipe=recipe).count())
+        self.assertEqual(RecipeRatingSummary.objects.get(recipe=recipe).rating_count, response.data['rating_count'])
+        self.assertMaxResponseSize(response, 256)
+
+    def test_leaderboard(self):
+        call_command('refresh_leaderboards', stdout=StringIO())
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('recipe-leaderboard'), {'window': '7d', 'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['rank'] for entry in response.data['results']], list(range(1, 11)))
+        scores = [entry['score'] for entry in response.data['results']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertMaxResponseSize(response, 2 * 1024)
+
+        response = self.client.get(reverse('recipe-leaderboard'), {'kind': 'most_favorited', 'region': 'cm'})
+        self.assertEqual(response.data['region'], 'cm')
+        top = response.data['results'][0]
+        self.assertEqual(top['favorite_count'], FavoriteRecipe.objects.filter(recipe=top['recipe'], user__region='cm').count())
+
+        response = self.client.get(reverse('recipe-leaderboard'), {'window': 'forever'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_activity_matches_rebuild(self):
+        # The buckets maintained on every write must equal a full recount from the raw tables
+        self.client.post(reverse('recipe-ratings-list-create'), {'recipe': self.own_rating.recipe_id, 'rating': self.own_rating.rating % 5 + 1}, format='json')
+        self.client.delete(reverse('favorite-recipe-destroy', args=[self.own_favorite.pk]))
+        fields = ('recipe', 'region', 'day', 'rating_count', 'rating_sum', 'favorite_count')
+        incremental = set(RecipeActivity.objects.exclude(rating_count=0, favorite_count=0).values_list(*fields))
+        call_command('refresh_leaderboards', '--rebuild-activity', stdout=StringIO())
+        self.assertEqual(incremental, set(RecipeActivity.objects.values_list(*fields)))
+        self.assertTrue(LeaderboardEntry.objects.filter(window='all', region='').exists())
+
+    def test_leaderboard_follows_writes(self):
+        # Writes re-rank the recipes they touch; a refresh only moves the top-rated prior mean
+        call_command('refresh_leaderboards', stdout=StringIO())
+        self.client.post(reverse('recipe-ratings-list-create'), {'recipe': self.unrated[0].pk, 'rating': 5}, format='json')
+        self.client.post(reverse('favorite-recipes-list-create'), {'recipe': self.unrated[1].pk}, format='json')
+        self.client.delete(reverse('favorite-recipe-destroy', args=[self.own_favorite.pk]))
+        touched = {self.unrated[0].pk, self.unrated[1].pk, self.own_favorite.recipe_id}
+
+        def boards():
+            favorited = LeaderboardEntry.objects.filter(kind='most_favorited').values_list('window', 'region', 'rank', 'recipe', 'favorite_count')
+            rated = LeaderboardEntry.objects.filter(kind='top_rated', recipe__in=touched).values_list('window', 'region', 'recipe', 'rating_count', 'average_rating')
+            return set(favorited), set(rated)
+
+        incremental = boards()
+        self.assertIn(self.unrated[0].pk, {row[2] for row in incremental[1]})
+        call_command('refresh_leaderboards', stdout=StringIO())
+        self.assertEqual(incremental, boards())
+
+    def test_recommendations(self):
+        call_command('build_recommendations', stdout=StringIO())
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse('recipe-recommendations'), {'limit': 10})
+        self.assertEqual(response.data['source'], 'personalized')
+        recommended = [item['recipe'] for item in response.data['results']]
+        self.assertEqual(len(recommended), 10)
+        seen = set(RecipeRating.objects.filter(user=self.user).values_list('recipe_id', flat=True))
+        self.assertFalse(seen & set(recommended))
+        self.assertMaxResponseSize(response, 1024)
+
+    def test_recommendations_cold_start(self):
+        call_command('refresh_leaderboards', stdout=StringIO())
+        newcomer = User.objects.create(username='newcomer', email='newcomer@example.com')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=newcomer).key}')
+        response = self.client.get(reverse('recipe-recommendations'), {'limit': 5})
+        self.assertEqual(response.data['source'], 'popular')
+        self.assertEqual(
+            [item['recipe'] for item in response.data['results']],
+            list(LeaderboardEntry.objects.filter(kind='top_rated', window='all', region='').values_list('recipe_id', flat=True)[:5]),
+        )
+
+    def test_incremental_recommendations_match_full_rebuild(self):
+        call_command('build_recommendations', stdout=StringIO())
+        built_at = ChangeLogCheckpoint.objects.get().last_event_id
+        self.client.post(reverse('recipe-ratings-list-create'), {'recipe': self.unrated[0].pk, 'rating': 5}, format='json')
+        self.client.post(reverse('favorite-recipes-list-create'), {'recipe': self.unrated[1].pk}, format='json')
+        self.client.delete(reverse('recipe-rating-detail', args=[self.own_rating.pk]))
+        touched = {self.unrated[0].pk, self.unrated[1].pk, self.own_rating.recipe_id}
+        self.assertEqual(set(RatingEvent.objects.filter(id__gt=built_at).values_list('recipe_id', flat=True)), touched)
+
+        with override_settings(RECOMMENDER={**settings.RECOMMENDER, 'SETTLE_SECONDS': 0}):
+            call_command('build_recommendations', '--incremental', stdout=StringIO())
+        incremental = self.neighbor_lists()
+        call_command('build_recommendations', stdout=StringIO())
+        full = self.neighbor_lists()
+        for recipe_id in touched:
+            self.assertEqual(incremental[recipe_id].keys(), full[recipe_id].keys())
+            for similar_id, score in full[recipe_id].items():
+                self.assertAlmostEqual(incremental[recipe_id][similar_id], score, places=4)
+        # Other recipes carry the touched recipes' new scores
+        for recipe_id, entries in full.items():
+            for similar_id in touched & entries.keys():
+                self.assertAlmostEqual(incremental[recipe_id][similar_id], entries[similar_id], places=4)
+        self.assertEqual(ChangeLogCheckpoint.objects.get().last_event_id, RatingEvent.objects.latest('id').id)
+
+    def neighbor_lists(self):
+        lists = {}
+        for recipe_id, similar_id, score in RecipeSimilarity.objects.values_list('recipe_id', 'similar_id', 'score'):
+            lists.setdefault(recipe_id, {})[similar_id] = score
+        return lists
+
+    def test_recipe_status(self):
+        page = self.recipes[:50]
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse('recipe-status'), {'recipe_ids': ','.join(str(recipe.pk) for recipe in page)})
+        self.assertEqual([item['recipe'] for item in response.data['results']], [recipe.pk for recipe in page])
+        favorited = set(FavoriteRecipe.objects.filter(user=self.user).values_list('recipe_id', flat=True))
+        ratings = dict(RecipeRating.objects.filter(user=self.user).values_list('recipe_id', 'rating'))
+        for item in response.data['results']:
+            self.assertEqual(item['favorited'], item['recipe'] in favorited)
+            self.assertEqual(item['rating'], ratings.get(item['recipe']))
+        self.assertMaxResponseSize(response, 4 * 1024)
+
+        response = self.client.get(reverse('recipe-status'), {'recipe_ids': 'soup'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(RATING_FAVORITE_ID_CACHE={'ENABLED': True, 'CACHE_ALIAS': 'default', 'TIMEOUT': 60})
+    def test_recipe_status_with_favorite_id_cache(self):
+        url, params = reverse('recipe-status'), {'recipe_ids': f'{self.own_favorite.recipe_id},{self.unrated[0].pk}'}
+        self.client.get(url, params)
+        with self.assertMaxQueries(1):
+            response = self.client.get(url, params)
+        self.assertEqual([item['favorited'] for item in response.data['results']], [True, False])
+
+        # Favorite writes drop the cached set
+        self.client.post(reverse('favorite-recipes-list-create'), {'recipe': self.unrated[0].pk}, format='json')
+        response = self.client.get(url, params)
+        self.assertEqual([item['favorited'] for item in response.data['results']], [True, True])
+
+    def test_export(self):
+        url = reverse('rating-export', args=['ratings'])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True) # Staff isn't enough, the role decides
+        invalidate_user_tokens(self.user.pk) # update() skips the post_save invalidation
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        User.objects.filter(pk=self.user.pk).update(role='admin')
+        invalidate_user_tokens(self.user.pk)
+        with self.settings(RECOMMENDER={**settings.RECOMMENDER, 'SETTLE_SECONDS': 0}):
+            response = self.client.get(url)
+            lines = b''.join(response.streaming_content).decode().splitlines()
+            self.assertEqual(len(lines), RecipeRating.objects.count())
+            since = int(response['X-Export-Watermark'])
+            self.assertEqual(since, RatingEvent.objects.latest('id').id)
+
+            # A re-rate, a deletion and a new rating, none of which a row id watermark would catch all of
+            rerated, deleted = RecipeRating.objects.filter(user=self.user).order_by('id')[:2]
+            self.client.patch(reverse('recipe-rating-detail', args=[rerated.pk]), {'rating': rerated.rating % 5 + 1}, format='json')
+            self.client.delete(reverse('recipe-rating-detail', args=[deleted.pk]))
+            self.client.post(reverse('recipe-ratings-list-create'), {'recipe': self.unrated[0].pk, 'rating': 4}, format='json')
+            with self.assertMaxQueries(3):
+                response = self.client.get(url, {'since': since})
+                rows = {row['recipe_id']: row for row in map(json.loads, b''.join(response.streaming_content).decode().splitlines())}
+            self.assertEqual(set(rows), {rerated.recipe_id, deleted.recipe_id, self.unrated[0].pk})
+            self.assertEqual(rows[rerated.recipe_id]['rating'], rerated.rating % 5 + 1)
+            self.assertEqual((rows[deleted.recipe_id]['deleted'], rows[deleted.recipe_id]['id']), (True, None))
+            self.assertFalse(rows[self.unrated[0].pk]['deleted'])
+            self.assertEqual(int(response['X-Export-Watermark']), RatingEvent.objects.latest('id').id)
+
+            with tempfile.NamedTemporaryFile('w') as watermark:
+                call_command('export_rating_data', 'ratings', watermark_file=watermark.name, output=os.devnull, stderr=StringIO())
+                stderr = StringIO()
+                call_command('export_rating_data', 'ratings', watermark_file=watermark.name, output=os.devnull, stderr=stderr)
+                self.assertIn('Exported 0 ratings rows', stderr.getvalue())
+
+        response = self.client.get(reverse('rating-export', args=['favorites']), {'output': 'csv'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ['id', 'user_id', 'recipe_id', 'created_at'])
+        self.assertEqual(len(rows) - 1, FavoriteRecipe.objects.count())
+
+@override_settings(
+    CACHES=SHARED_TEST_CACHES,
+    DATABASE_REPLICATION={'REPLICAS': ['replica_1'], 'STICKY_SECONDS': 5, 'CACHE_ALIAS': None, 'COOKIE_NAME': 'db_pin'},
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    """meal_project/db_router.py: where each request's reads go, and how writes pin the client."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+
+    def route(self, request, status=200):
+        """Run `request` through the middleware; returns (database reads went to, response)."""
+        seen = []
+        def view(request):
+            seen.append(self.router.db_for_read(RecipeRating))
+            return HttpResponse(status=status)
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen[0], response
+
+    def test_reads_and_writes(self):
+        self.assertEqual(self.router.db_for_write(RecipeRating), PRIMARY)
+        self.assertEqual(self.router.db_for_read(RecipeRating), PRIMARY) # Outside a request
+        self.assertEqual(self.route(self.factory.get('/'))[0], 'replica_1')
+        self.assertEqual(self.route(self.factory.post('/'))[0], PRIMARY)
+
+    def test_write_pins_client(self):
+        # Token clients get the cookie too: without a shared cache it is the only pin
+        db, response = self.route(self.factory.post('/', HTTP_AUTHORIZATION='Token abc'), status=201)
+        self.assertEqual(response.cookies['db_pin']['max-age'], 5)
+        self.factory.cookies['db_pin'] = response.cookies['db_pin'].value
+        self.assertEqual(self.route(self.factory.get('/', HTTP_AUTHORIZATION='Token abc'))[0], PRIMARY)
+
+    def test_failed_write_does_not_pin(self):
+        _, response = self.route(self.factory.post('/'), status=400)
+        self.assertNotIn('db_pin', response.cookies)
+
+    def test_shared_cache_pins_clients_without_cookies(self):
+        caches['shared'].clear()
+        with self.settings(DATABASE_REPLICATION={**settings.DATABASE_REPLICATION, 'CACHE_ALIAS': 'shared'}):
+            self.route(self.factory.post('/', HTTP_AUTHORIZATION='Token abc'))
+            self.assertEqual(self.route(self.factory.get('/', HTTP_AUTHORIZATION='Token abc'))[0], PRIMARY)
+            self.assertEqual(self.route(self.factory.get('/', HTTP_AUTHORIZATION='Token xyz'))[0], 'replica_1')
+
+    def test_process_local_cache_is_refused(self):
+        with self.settings(DATABASE_REPLICATION={**settings.DATABASE_REPLICATION, 'CACHE_ALIAS': 'default'}):
+            with self.assertRaises(ImproperlyConfigured):
+                ReplicaRoutingMiddleware(HttpResponse)
@@ -1,14 +1,38 @@
 from django.urls import path
+from meal_project.async_views import select_view
 from .views import (
+    AsyncFavoriteRecipeDestroyView,
+    AsyncFavoriteRecipeListCreateView,
+    AsyncRecipeRatingDetailView,
+    AsyncRecipeRatingListCreateView,
     FavoriteRecipeListCreateView,
     FavoriteRecipeDestroyView,
+    FavoriteRecipeBulkView,
     RecipeRatingListCreateView,
+    RecipeRatingBulkView,
     RecipeRatingDetailView,
+    RecipeRatingSummaryView,
+    LeaderboardView,
+    RecommendationView,
+    RecipeStatusView,
+    ExportView,
 )
 
 urlpatterns = [
-    path('favorites/', FavoriteRecipeListCreateView.as_view(), name='favorite-recipes-list-create'),
-    path('favorites/<int:pk>/', FavoriteRecipeDestroyView.as_view(), name='favorite-recipe-destroy'),
-    path('ratings/', RecipeRatingListCreateView.as_view(), name='recipe-ratings-list-create'),
-    path('ratings/<int:pk>/', RecipeRatingDetailView.as_view(), name='recipe-rating-detail'),
+    path('favorites/', select_view(FavoriteRecipeListCreateView, AsyncFavoriteRecipeListCreateView), name='favorite-recipes-list-create'),
+    path('favorites/<int:pk>/', select_view(FavoriteRecipeDestroyView, AsyncFavoriteRecipeDestroyView), name='favorite-recipe-destroy'),
+    path('favorites/bulk/', FavoriteRecipeBulkView.as_view(), name='favorite-recipes-bulk'),
+    path('ratings/', select_view(RecipeRatingListCreateView, AsyncRecipeRatingListCreateView), name='recipe-ratings-list-create'),
+    path('ratings/bulk/', RecipeRatingBulkView.as_view(), name='recipe-ratings-bulk'),
+    path('ratings/<int:pk>/', select_view(RecipeRatingDetailView, AsyncRecipeRatingDetailView), name='recipe-rating-detail'),
+    path('ratings/summary/<int:recipe_id>/', RecipeRatingSummaryView.as_view(), name='recipe-rating-summary'),
+    path('leaderboard/', LeaderboardView.as_view(), name='recipe-leaderboard'),
+    path('recommendations/', RecommendationView.as_view(), name='recipe-recommendations'),
+    path('status/', RecipeStatusView.as_view(), name='recipe-status'),
+    path('export/<str:name>/', ExportView.as_view(), name='rating-export'),
+    # Async variants, whatever settings.ASYNC_VIEWS says
+    path('async/favorites/', AsyncFavoriteRecipeListCreateView.as_view(), name='async-favorite-recipes-list-create'),
+    path('async/favorites/<int:pk>/', AsyncFavoriteRecipeDestroyView.as_view(), name='async-favorite-recipe-destroy'),
+    path('async/ratings/', AsyncRecipeRatingListCreateView.as_view(), name='async-recipe-ratings-list-create'),
+    path('async/ratings/<int:pk>/', AsyncRecipeRatingDetailView.as_view(), name='async-recipe-rating-detail'),
 ]
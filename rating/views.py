@@ -1,27 +1,99 @@
-from django.shortcuts import render
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Avg
+from rest_framework.views import APIView
+from rest_framework.exceptions import NotFound, ValidationError
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import Count
 
-from .models import FavoriteRecipe, RecipeRating
-from .serializers import FavoriteRecipeSerializer, RecipeRatingSerializer
+from meal_project.async_views import AsyncAPIView
+from users.models import DietaryTag
+from users.permissions import IsAdminUser
+
+from .caching import contains, get_favorite_ids, get_config as favorite_id_cache_config
+from .exports import EXPORTS, FORMATS as EXPORT_FORMATS, encode, export_rows, export_watermark
+from .models import (
+    FavoriteRecipe,
+    LeaderboardEntry,
+    RecipeRating,
+    RecipeRatingSummary,
+    RecipeSimilarity,
+    record_favorite_changes,
+    record_rating_changes,
+)
+from .pagination import KeysetPagination
+from .serializers import (
+    FavoriteRecipeSerializer,
+    LeaderboardEntrySerializer,
+    RecipeRatingSerializer,
+    RecipeRatingSummarySerializer,
+)
 # Assuming 'Recipe' model and permissions from Dev 2 will be available
 # from recipes.models import Recipe
 
+# Writes shared by the sync views and their async variants (which run them in a worker thread)
+
+def delete_favorite(user, favorite):
+    with transaction.atomic():
+        # Only the request whose delete removed the row records it; an overlapping one gets a 404
+        if FavoriteRecipe.objects.filter(pk=favorite.pk).delete()[0] != 1:
+            raise NotFound()
+        record_favorite_changes(user, [(favorite.recipe_id, favorite.created_at, -1)])
+
+def _lock_rating(rating):
+    # Re-read the row under a lock: the copy the view loaded may be stale, or already deleted
+    # by a concurrent request, and the summary deltas must come from what is actually stored
+    locked = RecipeRating.objects.select_for_update().filter(pk=rating.pk).first()
+    if locked is None:
+        raise NotFound()
+    return locked
+
+def save_rating_update(user, serializer):
+    # Keep the recipe summaries in step, including when the rating is moved to another recipe
+    with transaction.atomic():
+        serializer.instance = _lock_rating(serializer.instance)
+        previous_recipe_id, previous_rating = serializer.instance.recipe_id, serializer.instance.rating
+        rating = serializer.save()
+        if rating.recipe_id == previous_recipe_id:
+            changes = [(rating.recipe_id, previous_rating, rating.rating)]
+        else:
+            changes = [(previous_recipe_id, previous_rating, None), (rating.recipe_id, None, rating.rating)]
+        RecipeRatingSummary.objects.apply_changes(changes)
+        record_rating_changes(
+            user, [(recipe_id, rating.created_at, previous, current) for recipe_id, previous, current in changes],
+        )
+
+def delete_rating(user, rating):
+    with transaction.atomic():
+        rating = _lock_rating(rating)
+        # Only the request whose DELETE removed the row takes it out of the summaries
+        if RecipeRating.objects.filter(pk=rating.pk).delete()[0] != 1:
+            raise NotFound()
+        RecipeRatingSummary.objects.apply_changes([(rating.recipe_id, rating.rating, None)])
+        record_rating_changes(user, [(rating.recipe_id, rating.created_at, rating.rating, None)])
+
 class FavoriteRecipeListCreateView(generics.ListCreateAPIView):
     serializer_class = FavoriteRecipeSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return FavoriteRecipe.objects.filter(user=self.request.user)
 
-    def perform_create(self, serializer):
-        # Ensure the user can only favorite a recipe once
-        recipe_id = self.request.data.get('recipe')
-        if FavoriteRecipe.objects.filter(user=self.request.user, recipe_id=recipe_id).exists():
-            raise serializer.ValidationError("You have already favorited this recipe.")
-        serializer.save(user=self.request.user)
+    def create(self, request, *args, **kwargs):
+        # Favoriting is idempotent: 201 when the favorite is new, 200 when it already existed
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        favorite, created = FavoriteRecipe.objects.add(request.user, serializer.validated_data['recipe'])
+        return Response(
+            self.get_serializer(favorite).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
 class FavoriteRecipeDestroyView(generics.DestroyAPIView):
     queryset = FavoriteRecipe.objects.all()
     permission_classes = [IsAuthenticated]
@@ -30,9 +102,94 @@ class FavoriteRecipeDestroyView(generics.DestroyAPIView):
         # Ensure users can only delete their own favorites
         return FavoriteRecipe.objects.filter(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        delete_favorite(self.request.user, instance)
+
+class BulkWriteView(APIView):
+    """
+    Base for the bulk endpoints: accepts a JSON list of items, loads every referenced recipe
+    in one query, validates the whole batch with `serializer_class(many=True)` and hands the
+    validated items to `perform_bulk_write`, which returns one result per item. Subclasses
+    must set both, which is checked when the subclass is defined.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.serializer_class is None or not callable(getattr(cls, 'perform_bulk_write', None)):
+            raise ImproperlyConfigured(f'{cls.__name__} must set serializer_class and define perform_bulk_write(items).')
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Expected a list of items.'}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = getattr(settings, 'RATING_BULK_MAX_ITEMS', 500)
+        if len(items) > max_items:
+            return Response({'detail': f'At most {max_items} items can be sent at once.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        recipe_ids = set()
+        for item in items:
+            try:
+                recipe_ids.add(int(item['recipe']))
+            except (KeyError, TypeError, ValueError):
+                pass # Reported by the serializer below
+        recipe_model = self.serializer_class.Meta.model._meta.get_field('recipe').related_model
+        context = {
+            'request': request,
+            'view': self,
+            'prefetched': {'recipe': recipe_model._default_manager.in_bulk(recipe_ids)},
+        }
+        serializer = self.serializer_class(data=items, many=True, context=context)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = self.perform_bulk_write(serializer.validated_data)
+        except IntegrityError:
+            return Response({'detail': 'A concurrent request changed these items, please retry.'}, status=status.HTTP_409_CONFLICT)
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    def _last_occurrences(self, items):
+        # Later items for the same recipe win; earlier ones are reported as duplicates
+        return {item['recipe'].pk: index for index, item in enumerate(items)}
+
+class FavoriteRecipeBulkView(BulkWriteView):
+    serializer_class = FavoriteRecipeSerializer
+
+    def perform_bulk_write(self, items):
+        last = self._last_occurrences(items)
+        outcome = FavoriteRecipe.objects.bulk_add(self.request.user, list(last))
+        results = []
+        for index, item in enumerate(items):
+            recipe_id = item['recipe'].pk
+            if last[recipe_id] != index:
+                results.append({'recipe': recipe_id, 'status': 'duplicate'})
+                continue
+            favorite, created = outcome[recipe_id]
+            results.append({'recipe': recipe_id, 'status': 'created' if created else 'exists', 'id': favorite.pk})
+        return results
+
+class RecipeRatingBulkView(BulkWriteView):
+    serializer_class = RecipeRatingSerializer
+
+    def perform_bulk_write(self, items):
+        last = self._last_occurrences(items)
+        outcome = RecipeRating.objects.bulk_rate(self.request.user, {item['recipe'].pk: item['rating'] for item in items})
+        results = []
+        for index, item in enumerate(items):
+            recipe_id = item['recipe'].pk
+            if last[recipe_id] != index:
+                results.append({'recipe': recipe_id, 'status': 'duplicate'})
+                continue
+            rating, outcome_status = outcome[recipe_id]
+            results.append({'recipe': recipe_id, 'status': outcome_status, 'id': rating.pk, 'rating': rating.rating})
+        return results
+
 class RecipeRatingListCreateView(generics.ListCreateAPIView):
     serializer_class = RecipeRatingSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         # You might want to list ratings for a specific recipe, or all ratings by a user
@@ -41,12 +198,17 @@ class RecipeRatingListCreateView(generics.ListCreateAPIView):
             return RecipeRating.objects.filter(recipe_id=recipe_id)
         return RecipeRating.objects.filter(user=self.request.user)
 
-    def perform_create(self, serializer):
-        # Ensure a user can only rate a recipe once
-        recipe_id = self.request.data.get('recipe')
-        if RecipeRating.objects.filter(user=self.request.user, recipe_id=recipe_id).exists():
-            raise serializer.ValidationError("You have already rated this recipe.")
-        serializer.save(user=self.request.user)
+    def create(self, request, *args, **kwargs):
+        # Rate or re-rate: 201 when the rating is new, 200 when an existing one was updated
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rating, created = RecipeRating.objects.rate(
+            request.user, serializer.validated_data['recipe'], serializer.validated_data['rating']
+        )
+        return Response(
+            self.get_serializer(rating).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
 class RecipeRatingDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = RecipeRating.objects.all()
     serializer_class = RecipeRatingSerializer
@@ -56,4 +218,253 @@ class RecipeRatingDetailView(generics.RetrieveUpdateDestroyAPIView):
         # Ensure users can only modify/delete their own ratings
         return RecipeRating.objects.filter(user=self.request.user)
 
+    def perform_update(self, serializer):
+        save_rating_update(self.request.user, serializer)
+
+    def perform_destroy(self, instance):
+        delete_rating(self.request.user, instance)
+
+class RecipeRatingSummaryView(generics.RetrieveAPIView):
+    serializer_class = RecipeRatingSummarySerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self):
+        # Recipes nobody has rated yet have no summary row; report them as empty
+        recipe_id = self.kwargs['recipe_id']
+        summary = RecipeRatingSummary.objects.filter(recipe_id=recipe_id).first()
+        return summary or RecipeRatingSummary(recipe_id=recipe_id)
+
+class LeaderboardView(generics.ListAPIView):
+    """
+    GET ?kind=top_rated|most_favorited&window=7d|30d|all&region=<region>&limit=N
+
+    Serves the stored boards, patched on every write and rebuilt by `manage.py
+    refresh_leaderboards`: one indexed range read, however many ratings and favorites exist.
+    Without `region` the board covers all regions.
+    """
+    serializer_class = LeaderboardEntrySerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = None
+
+    def get_queryset(self):
+        config = settings.LEADERBOARD
+        params = self.request.query_params
+        self.kind = params.get('kind', LeaderboardEntry.TOP_RATED)
+        self.window = params.get('window', next(iter(config['WINDOWS'])))
+        self.region = params.get('region', '')
+        errors = {}
+        if self.kind not in dict(LeaderboardEntry.KIND_CHOICES):
+            errors['kind'] = f"Expected one of {', '.join(dict(LeaderboardEntry.KIND_CHOICES))}."
+        if self.window not in config['WINDOWS']:
+            errors['window'] = f"Expected one of {', '.join(config['WINDOWS'])}."
+        try:
+            limit = min(int(params.get('limit', 20)), config['SIZE'])
+        except ValueError:
+            errors['limit'] = 'Expected an integer.'
+        if errors:
+            raise ValidationError(errors)
+        return LeaderboardEntry.objects.filter(
+            kind=self.kind, window=self.window, region=self.region, rank__lte=limit,
+        )
+
+    def list(self, request, *args, **kwargs):
+        entries = list(self.get_queryset())
+        return Response({
+            'kind': self.kind,
+            'window': self.window,
+            'region': self.region or None,
+            'computed_at': entries[0].computed_at if entries else None,
+            'results': self.get_serializer(entries, many=True).data,
+        })
+
+class RecommendationView(APIView):
+    """
+    GET ?limit=N: recipes for the current user from the item-item similarities precomputed
+    by `manage.py build_recommendations`, restricted to recipes carrying all of the user's
+    dietary tags when settings.RECOMMENDER['RECIPE_TAG_LOOKUP'] says where recipes keep
+    theirs. Users with no ratings or favorites yet get the all-time top-rated leaderboard.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        config = settings.RECOMMENDER
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), config['MAX_RESULTS']))
+        except ValueError:
+            raise ValidationError({'limit': 'Expected an integer.'})
+
+        # Over-fetch so the dietary filter below can still fill the page; without a lookup
+        # there is nothing to filter on, so don't load the tags at all
+        lookup = config['RECIPE_TAG_LOOKUP']
+        tags = list(DietaryTag.objects.filter(preferences__user=request.user).values_list('name', flat=True)) if lookup else []
+        fetch = limit * 3 if tags else limit
+        recommendations = RecipeSimilarity.objects.recommend(request.user, fetch, config)
+        source = 'personalized'
+        if not recommendations:
+            source = 'popular'
+            windows = settings.LEADERBOARD['WINDOWS']
+            longest = max(windows, key=lambda window: windows[window] or float('inf'))
+            board = LeaderboardEntry.objects.filter(kind=LeaderboardEntry.TOP_RATED, window=longest, region='')
+            recommendations = list(board.values_list('recipe_id', 'score')[:fetch])
+
+        if tags:
+            recipe_model = RecipeSimilarity._meta.get_field('recipe').related_model
+            allowed = set(
+                recipe_model._default_manager.filter(
+                    pk__in=[recipe_id for recipe_id, _ in recommendations], **{f'{lookup}__in': tags},
+                ).values('pk').annotate(matched=Count(lookup, distinct=True)).filter(matched=len(tags)).values_list('pk', flat=True)
+            )
+            recommendations = [item for item in recommendations if item[0] in allowed]
+
+        return Response({
+            'source': source,
+            'results': [{'recipe': recipe_id, 'score': round(score, 4)} for recipe_id, score in recommendations[:limit]],
+        })
+
+class RecipeStatusView(APIView):
+    """
+    GET ?recipe_ids=1,2,3: whether the user favorited each recipe and what they rated it,
+    for a page of recipe cards. Two indexed IN queries (one with the favorite ID cache
+    enabled), so the cost follows the page size, not the user's history.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        max_ids = getattr(settings, 'RATING_STATUS_MAX_IDS', 100)
+        try:
+            recipe_ids = list(dict.fromkeys(int(value) for value in request.query_params.get('recipe_ids', '').split(',') if value.strip()))
+        except ValueError:
+            raise ValidationError({'recipe_ids': 'Expected a comma-separated list of recipe IDs.'})
+        if not recipe_ids:
+            raise ValidationError({'recipe_ids': 'This parameter is required.'})
+        if len(recipe_ids) > max_ids:
+            raise ValidationError({'recipe_ids': f'At most {max_ids} recipe IDs can be looked up at once.'})
+
+        if favorite_id_cache_config()['ENABLED']:
+            favorite_ids = get_favorite_ids(request.user)
+            favorited = {recipe_id for recipe_id in recipe_ids if contains(favorite_ids, recipe_id)}
+        else:
+            favorited = set(FavoriteRecipe.objects.filter(user=request.user, recipe_id__in=recipe_ids).values_list('recipe_id', flat=True))
+        ratings = dict(RecipeRating.objects.filter(user=request.user, recipe_id__in=recipe_ids).values_list('recipe_id', 'rating'))
+        return Response({'results': [
+            {'recipe': recipe_id, 'favorited': recipe_id in favorited, 'rating': ratings.get(recipe_id)}
+            for recipe_id in recipe_ids
+        ]})
+
+class ExportView(APIView):
+    """
+    GET /export/<ratings|favorites>/?output=ndjson|csv&since=<watermark>: the whole table (or
+    the changes after the `since` watermark, see rating/exports.py) streamed for the data
+    team, admins only. X-Export-Since echoes `since`; X-Export-Watermark is the one to pass next.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request, name):
+        if name not in EXPORTS:
+            raise NotFound(f"No export named {name!r}.")
+        fmt = request.query_params.get('output', 'ndjson')
+        if fmt not in EXPORT_FORMATS:
+            raise ValidationError({'output': f"Expected one of {', '.join(EXPORT_FORMATS)}."})
+        since = request.query_params.get('since')
+        try:
+            since = int(since) if since else None
+        except ValueError:
+            raise ValidationError({'since': 'Expected a watermark from an earlier export.'})
+
+        upto = export_watermark()
+        fields, rows = export_rows(name, since=since, upto=upto)
+        response = StreamingHttpResponse(encode(fmt, fields, rows), content_type=EXPORT_FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+        response['X-Export-Since'] = str(since or 0)
+        response['X-Export-Watermark'] = str(max(upto, since or 0))
+        return response
+
+# Async variants (meal_project/async_views.py), routed under async/ or, with
+# settings.ASYNC_VIEWS, in place of the views above. Same requests and responses; reads use
+# the async ORM, transactional writes run in a worker thread (there are no async transactions).
+
+async def avalidate(serializer_class, request, instance=None, partial=False):
+    """
+    Validate request.data like the sync views do, with the recipe it references loaded by
+    the async ORM (PrimaryKeyRelatedField would query synchronously).
+    """
+    data = request.data
+    recipes = {}
+    try:
+        recipe_id = int(data['recipe'])
+    except (KeyError, TypeError, ValueError):
+        pass # Reported by the serializer
+    else:
+        recipe_model = serializer_class.Meta.model._meta.get_field('recipe').related_model
+        recipe = await recipe_model._default_manager.filter(pk=recipe_id).afirst()
+        if recipe is not None:
+            recipes[recipe_id] = recipe
+    context = {'request': request, 'prefetched': {'recipe': recipes}}
+    serializer = serializer_class(instance, data=data, partial=partial, context=context)
+    serializer.is_valid(raise_exception=True)
+    return serializer
+
+class AsyncFavoriteRecipeListCreateView(AsyncAPIView):
+    sync_view = FavoriteRecipeListCreateView
+
+    async def get(self, request):
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(FavoriteRecipe.objects.filter(user=request.user), request)
+        return JsonResponse(paginator.get_paginated_data(FavoriteRecipeSerializer(page, many=True).data))
+
+    async def post(self, request):
+        serializer = await avalidate(FavoriteRecipeSerializer, request)
+        favorite, created = await FavoriteRecipe.objects.aadd(request.user, serializer.validated_data['recipe'])
+        return JsonResponse(
+            FavoriteRecipeSerializer(favorite).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+class AsyncFavoriteRecipeDestroyView(AsyncAPIView):
+    sync_view = FavoriteRecipeDestroyView
+
+    async def delete(self, request, pk):
+        favorite = await aget_object_or_404(FavoriteRecipe.objects.filter(user=request.user), pk=pk)
+        await sync_to_async(delete_favorite)(request.user, favorite)
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+class AsyncRecipeRatingListCreateView(AsyncAPIView):
+    sync_view = RecipeRatingListCreateView
+
+    async def get(self, request):
+        recipe_id = request.query_params.get('recipe_id')
+        ratings = RecipeRating.objects.filter(recipe_id=recipe_id) if recipe_id else RecipeRating.objects.filter(user=request.user)
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(ratings, request)
+        return JsonResponse(paginator.get_paginated_data(RecipeRatingSerializer(page, many=True).data))
+
+    async def post(self, request):
+        serializer = await avalidate(RecipeRatingSerializer, request)
+        rating, created = await RecipeRating.objects.arate(
+            request.user, serializer.validated_data['recipe'], serializer.validated_data['rating']
+        )
+        return JsonResponse(
+            RecipeRatingSerializer(rating).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+class AsyncRecipeRatingDetailView(AsyncAPIView):
+    sync_view = RecipeRatingDetailView
+
+    async def get_object(self, request, pk):
+        return await aget_object_or_404(RecipeRating.objects.filter(user=request.user), pk=pk)
+
+    async def get(self, request, pk):
+        return JsonResponse(RecipeRatingSerializer(await self.get_object(request, pk)).data)
+
+    async def put(self, request, pk, partial=False):
+        serializer = await avalidate(RecipeRatingSerializer, request, await self.get_object(request, pk), partial=partial)
+        await sync_to_async(save_rating_update)(request.user, serializer)
+        return JsonResponse(serializer.data)
+
+    async def patch(self, request, pk):
+        return await self.put(request, pk, partial=True)
 
+    async def delete(self, request, pk):
+        await sync_to_async(delete_rating)(request.user, await self.get_object(request, pk))
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
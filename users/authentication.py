@@ -0,0 +1,324 @@
+# users/authentication.py
+
+import hashlib
+import pickle
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+from .caching import TTLCache
+
+
+class NoTokenCache:
+    """Caches nothing: every request loads its token from the database."""
+    def __init__(self, **kwargs):
+        pass
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def add(self, key, value):
+        pass
+
+    def incr(self, key):
+        pass
+
+    async def aget(self, key):
+        return None
+
+    async def aset(self, key, value):
+        pass
+
+    async def aadd(self, key, value):
+        pass
+
+    async def adelete(self, key):
+        pass
+
+
+class LocalTokenCache:
+    """Keeps cached tokens in this process only; invalidations don't reach other workers."""
+    def __init__(self, timeout, max_entries, **kwargs):
+        self._cache = TTLCache(max_entries=max_entries, timeout=timeout)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def add(self, key, value):
+        with self._lock:
+            if self._cache.get(key) is None:
+                self._cache.set(key, value)
+
+    def incr(self, key):
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                raise ValueError(f'Key {key!r} not found.')
+            self._cache.set(key, value + 1)
+
+    # In-memory, so safe to call from the event loop
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+    async def aadd(self, key, value):
+        self.add(key, value)
+
+    async def adelete(self, key):
+        self.delete(key)
+
+
+class DjangoTokenCache:
+    """Keeps cached tokens in one of the CACHES aliases, shared by every worker using it."""
+    def __init__(self, timeout, cache_alias='default', **kwargs):
+        self._cache = caches[cache_alias]
+        self._timeout = timeout
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value, self._timeout)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def add(self, key, value):
+        self._cache.add(key, value, None)
+
+    def incr(self, key):
+        self._cache.incr(key)
+
+    async def aget(self, key):
+        return await self._cache.aget(key)
+
+    async def aset(self, key, value):
+        await self._cache.aset(key, value, self._timeout)
+
+    async def aadd(self, key, value):
+        await self._cache.aadd(key, value, None)
+
+    async def adelete(self, key):
+        await self._cache.adelete(key)
+
+
+TOKEN_CACHE_BACKENDS = {
+    'none': NoTokenCache,
+    'local': LocalTokenCache,
+    'django': DjangoTokenCache,
+}
+
+_token_cache = None
+
+
+def get_token_cache_config():
+    return {'BACKEND': 'none', 'TIMEOUT': 300, 'MAX_ENTRIES': 10000, 'CACHE_ALIAS': 'default', **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        config = get_token_cache_config()
+        _token_cache = TOKEN_CACHE_BACKENDS[config['BACKEND']](
+            timeout=config['TIMEOUT'],
+            max_entries=config['MAX_ENTRIES'],
+            cache_alias=config['CACHE_ALIAS'],
+        )
+    return _token_cache
+
+
+def reset_token_cache():
+    """Forget the cache backend (and, for 'local', everything in it); rebuilt on next use."""
+    global _token_cache
+    _token_cache = None
+
+
+@receiver(setting_changed)
+def _reset_token_cache(setting, **kwargs):
+    if setting == 'TOKEN_AUTH_CACHE':
+        reset_token_cache()
+
+
+def get_token_ttl():
+    """Lifetime of an auth token as a timedelta, or None when tokens never expire."""
+    ttl = getattr(settings, 'AUTH_TOKEN_TTL', None)
+    return timedelta(seconds=ttl) if ttl is not None else None
+
+
+def is_token_expired(token, now=None):
+    ttl = get_token_ttl()
+    if ttl is None:
+        return False
+    return token.created <= (now or timezone.now()) - ttl
+
+
+def _token_cache_key(key):
+    # Never use the raw token as a cache key, shared caches may be inspectable
+    return 'users:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+# Cached tokens carry the generation their user was at when they were cached, and are
+# only trusted while it is still current. Invalidating a user's tokens is then one atomic incr,
+# with no per-user list of cache keys for concurrent requests to overwrite.
+
+def _generation_key(user_id):
+    return f'users:token-generation:{user_id}'
+
+
+def _current_generation(cache, user_id):
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock rather than 1, so a generation lost to eviction can't come
+        # back with a number that stale entries still carry
+        cache.add(key, time.time_ns())
+        generation = cache.get(key)
+    return generation
+
+
+async def _acurrent_generation(cache, user_id):
+    key = _generation_key(user_id)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, time.time_ns())
+        generation = await cache.aget(key)
+    return generation
+
+
+def _dump_token(generation, token):
+    # Only what authentication needs: the password hash stays out of the (shared) cache
+    user = token.user
+    user_fields = [field.attname for field in user._meta.concrete_fields if field.attname != 'password']
+    token_fields = [field.attname for field in token._meta.concrete_fields]
+    return pickle.dumps((
+        generation, token._state.db,
+        token_fields, [getattr(token, name) for name in token_fields],
+        user_fields, [getattr(user, name) for name in user_fields],
+    ), pickle.HIGHEST_PROTOCOL)
+
+
+def _load_cached_token(model, cached):
+    """(generation, token) from a _dump_token() entry; the user's password is deferred."""
+    generation, db, token_fields, token_values, user_fields, user_values = pickle.loads(cached)
+    token = model.from_db(db, token_fields, token_values)
+    token.user = model._meta.get_field('user').related_model.from_db(db, user_fields, user_values)
+    return generation, token
+
+
+def invalidate_token(key):
+    """Drop a single token from the authentication cache."""
+    if key:
+        get_token_cache().delete(_token_cache_key(key))
+
+
+def invalidate_user_tokens(user_id):
+    """Drop every cached token of a user, e.g. after a password change or deactivation."""
+    try:
+        get_token_cache().incr(_generation_key(user_id))
+    except ValueError: # No generation yet, so nothing cached for the user
+        pass
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for DRF's TokenAuthentication that caches the token -> user lookup,
+    so only a cache miss pays for the Token/CustomUser join.
+
+    Entries hold the token's and user's fields, bar the password hash (loaded on first
+    access), and are rebuilt per request, so every request gets its own user instance. They
+    expire after TOKEN_AUTH_CACHE['TIMEOUT'] seconds and are invalidated when the user is
+    saved (password change, deactivation, ...) or logs out, in every worker sharing the
+    cache; a process-local cache leaves other workers serving the entry until it expires.
+    Tokens older than AUTH_TOKEN_TTL are rejected.
+    """
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cache_key = _token_cache_key(key)
+        token = None
+        cached = cache.get(cache_key)
+        if cached is not None:
+            generation, token = _load_cached_token(self.get_model(), cached)
+            if cache.get(_generation_key(token.user_id)) != generation:
+                token = None
+        if token is None:
+            token = self._load_token(key)
+            generation = _current_generation(cache, token.user_id)
+            cache.set(cache_key, _dump_token(generation, token))
+
+        if is_token_expired(token):
+            invalidate_token(key)
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        return self._check(token)
+
+    def _load_token(self, key):
+        model = self.get_model()
+        try:
+            return model.objects.select_related('user').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+    def _check(self, token):
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (token.user, token)
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for the async views: the same header, cache and checks, with cache
+        misses loaded through the async ORM. Returns None without a token header.
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+
+        cache = get_token_cache()
+        cache_key = _token_cache_key(key)
+        token = None
+        cached = await cache.aget(cache_key)
+        model = self.get_model()
+        if cached is not None:
+            generation, token = _load_cached_token(model, cached)
+            if await cache.aget(_generation_key(token.user_id)) != generation:
+                token = None
+        if token is None:
+            try:
+                token = await model.objects.select_related('user').aget(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            generation = await _acurrent_generation(cache, token.user_id)
+            await cache.aset(cache_key, _dump_token(generation, token))
+
+        if is_token_expired(token):
+            await cache.adelete(cache_key)
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        return self._check(token)
@@ -0,0 +1,38 @@
+# users/backends.py
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+UserModel = get_user_model()
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """
+    Authenticates with either the username or the email address (case-insensitive),
+    resolving both in a single query backed by the username and lower(email) unique indexes.
+    """
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        login = username or email or kwargs.get(UserModel.USERNAME_FIELD)
+        if not login or password is None:
+            return None
+
+        candidates = list(
+            UserModel._default_manager
+            .alias(email_lower=Lower('email'))
+            .filter(Q(username=login) | (Q(email_lower=login.lower()) & ~Q(email='')))[:2]
+        )
+        # A username that happens to equal someone else's email wins over the email match
+        user = next((candidate for candidate in candidates if candidate.username == login), None)
+        if user is None and candidates:
+            user = candidates[0]
+
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user (#20760).
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,155 @@
+# users/caching.py
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class TTLCache:
+    """
+    Thread-safe, process-local LRU cache whose entries expire `timeout` seconds after being set.
+    Once `max_entries` is reached, the least recently used entry is evicted.
+    """
+    def __init__(self, max_entries=1024, timeout=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires_at, value = self._data[key]
+            except KeyError:
+                return default
+            if expires_at <= self._clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires_at = self._clock() + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def is_process_local_cache(cache):
+    """True for CACHES backends whose entries no other process can see (or that keep none)."""
+    return isinstance(cache, (LocMemCache, DummyCache))
+
+
+# Per-user payload cache
+#
+# Serialized per-user payloads (profile, dietary preferences) are cached under the user's
+# current version number. Any change to the user bumps the version (see users/signals.py),
+# which orphans the old entries instead of having to find and delete them, and gives a
+# cheap ETag: a client whose ETag matches the current version can get a 304 without the
+# payload being built or even read.
+#
+# The version has to be seen by every worker, so the cache must be shared: the users.E001
+# check refuses a process-local alias. Without an alias, nothing is cached, the version
+# functions return None and the ETag is derived from the payload itself.
+
+def get_payload_cache():
+    """The USER_PAYLOAD_CACHE_ALIAS cache, or None when payload caching is off."""
+    alias = getattr(settings, 'USER_PAYLOAD_CACHE_ALIAS', None)
+    return caches[alias] if alias is not None else None
+
+
+def _version_key(user_id):
+    return f'users:payload-version:{user_id}'
+
+
+def get_payload_version(user_id):
+    cache = get_payload_cache()
+    if cache is None:
+        return None
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Start from the clock rather than 1, so a version key lost to eviction can't
+        # come back with a number that still has stale payloads cached under it
+        cache.add(_version_key(user_id), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+async def aget_payload_version(user_id):
+    """get_payload_version() for async views."""
+    cache = get_payload_cache()
+    if cache is None:
+        return None
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        await cache.aadd(_version_key(user_id), time.time_ns(), timeout=None)
+        version = await cache.aget(_version_key(user_id))
+    return version
+
+
+def bump_payload_version(user_id):
+    cache = get_payload_cache()
+    if cache is None:
+        return
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError: # No version yet, nothing cached to invalidate
+        pass
+
+
+def payload_etag(name, user_id, version):
+    return f'"{name}-{user_id}-{version}"'
+
+
+def payload_digest(payload):
+    """Stands in for the version in the ETag when payloads aren't cached."""
+    content = json.dumps(payload, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+def get_cached_payload(name, user_id, version, build):
+    """Return the `name` payload of the user at `version`, calling `build()` on a miss."""
+    cache = get_payload_cache()
+    if cache is None or version is None:
+        return build()
+    key = f'users:payload:{name}:{user_id}:{version}'
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload, getattr(settings, 'USER_PAYLOAD_CACHE_TIMEOUT', 3600))
+    return payload
+
+
+async def aget_cached_payload(name, user_id, version, build):
+    """get_cached_payload() for async views; `build` is a coroutine function."""
+    cache = get_payload_cache()
+    if cache is None or version is None:
+        return await build()
+    key = f'users:payload:{name}:{user_id}:{version}'
+    payload = await cache.aget(key)
+    if payload is None:
+        payload = await build()
+        await cache.aset(key, payload, getattr(settings, 'USER_PAYLOAD_CACHE_TIMEOUT', 3600))
+    return payload
@@ -0,0 +1,36 @@
+# users/checks.py
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error, Tags, register
+
+from .authentication import get_token_cache_config
+from .caching import is_process_local_cache
+
+
+@register(Tags.caches)
+def check_payload_cache(app_configs, **kwargs):
+    # Payload versions live in the cache; a per-process one would let the other workers serve
+    # a stale profile (and a stale ETag) until the entry expires
+    alias = getattr(settings, 'USER_PAYLOAD_CACHE_ALIAS', None)
+    if alias is None or not is_process_local_cache(caches[alias]):
+        return []
+    return [Error(
+        f"USER_PAYLOAD_CACHE_ALIAS points at the process-local cache '{alias}'.",
+        hint='Use a CACHES alias shared by every worker (Redis, Memcached, database), or set it to None to disable payload caching.',
+        id='users.E001',
+    )]
+
+
+@register(Tags.caches)
+def check_token_cache(app_configs, **kwargs):
+    # Logout, password changes and deactivation revoke cached tokens through this cache; a
+    # per-process one would leave the other workers accepting them until the entry expires
+    config = get_token_cache_config()
+    if config['BACKEND'] != 'django' or not is_process_local_cache(caches[config['CACHE_ALIAS']]):
+        return []
+    return [Error(
+        f"TOKEN_AUTH_CACHE uses the process-local cache '{config['CACHE_ALIAS']}'.",
+        hint="Point CACHE_ALIAS at a CACHES alias shared by every worker (Redis, Memcached, database), or set BACKEND to 'none'.",
+        id='users.E002',
+    )]
@@ -0,0 +1,149 @@
+# users/google.py
+
+import asyncio
+import hashlib
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .caching import TTLCache
+
+DEFAULTS = {
+    'USERINFO_URL': 'https://www.googleapis.com/oauth2/v3/userinfo',
+    'TIMEOUT': 5.0,  # seconds, for connect/read/write/pool each
+    'MAX_CONNECTIONS': 20,
+    'CACHE_TIMEOUT': 60,  # seconds a successful userinfo response is reused
+    'CACHE_MAX_ENTRIES': 10000,
+    # Dotted path to a callable returning an httpx transport for both the sync and async
+    # clients, e.g. one building an httpx.MockTransport so tests never reach Google.
+    # None uses the network.
+    'TRANSPORT': None,
+}
+
+
+class GoogleAuthError(Exception):
+    """Google rejected the access token."""
+
+
+class GoogleUnavailableError(Exception):
+    """Google couldn't be reached or answered with a server error."""
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GOOGLE_USERINFO', {})}
+
+
+# The sync client is shared by every thread of the process; async clients are kept one per
+# event loop, as httpx connections can't be shared across loops. Under ASGI that is a single
+# client for the server's loop; under WSGI, where every async view gets a loop of its own,
+# AsyncGoogleLoginView uses the sync client instead.
+_client = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+_userinfo_cache = None
+
+
+def reset_clients():
+    """Close the sync client and forget every client and cached userinfo; rebuilt on next use."""
+    global _client, _userinfo_cache
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+    _async_clients.clear()
+    _userinfo_cache = None
+
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs):
+    if setting == 'GOOGLE_USERINFO':
+        reset_clients()
+
+
+def _client_options():
+    config = get_config()
+    return {
+        'timeout': httpx.Timeout(config['TIMEOUT']),
+        'limits': httpx.Limits(max_connections=config['MAX_CONNECTIONS']),
+        'transport': import_string(config['TRANSPORT'])() if config['TRANSPORT'] else None,
+    }
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(**_client_options())
+        return _client
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_client_options())
+        _async_clients[loop] = client
+    return client
+
+
+def _get_userinfo_cache():
+    global _userinfo_cache
+    if _userinfo_cache is None:
+        config = get_config()
+        _userinfo_cache = TTLCache(max_entries=config['CACHE_MAX_ENTRIES'], timeout=config['CACHE_TIMEOUT'])
+    return _userinfo_cache
+
+
+def _cache_key(access_token):
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def _request_kwargs(access_token):
+    return {'url': get_config()['USERINFO_URL'], 'headers': {'Authorization': f'Bearer {access_token}'}}
+
+
+def _read_userinfo(resp):
+    if resp.status_code >= 500:
+        raise GoogleUnavailableError(f'Google answered {resp.status_code}')
+    if resp.status_code != 200:
+        raise GoogleAuthError(f'Google answered {resp.status_code}')
+    try:
+        return resp.json()
+    except ValueError as exc:
+        raise GoogleUnavailableError('Google answered with invalid JSON') from exc
+
+
+def fetch_userinfo(access_token):
+    """
+    Return Google's userinfo for `access_token`. Successful answers are cached briefly,
+    so a client retrying a login doesn't hit Google again.
+    """
+    cache = _get_userinfo_cache()
+    userinfo = cache.get(_cache_key(access_token))
+    if userinfo is None:
+        try:
+            resp = get_client().get(**_request_kwargs(access_token))
+        except httpx.HTTPError as exc:
+            raise GoogleUnavailableError(str(exc)) from exc
+        userinfo = _read_userinfo(resp)
+        cache.set(_cache_key(access_token), userinfo)
+    return dict(userinfo)
+
+
+async def afetch_userinfo(access_token):
+    """fetch_userinfo() on the event loop, with the loop's async client."""
+    cache = _get_userinfo_cache()
+    userinfo = cache.get(_cache_key(access_token))
+    if userinfo is None:
+        try:
+            resp = await get_async_client().get(**_request_kwargs(access_token))
+        except httpx.HTTPError as exc:
+            raise GoogleUnavailableError(str(exc)) from exc
+        userinfo = _read_userinfo(resp)
+        cache.set(_cache_key(access_token), userinfo)
+    return dict(userinfo)
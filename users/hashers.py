@@ -0,0 +1,50 @@
+# users/hashers.py
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher
+
+
+class TunedParameter:
+    """
+    Hasher cost parameter read from settings.PASSWORD_HASHER_PARAMS[<hasher profile>][<name>],
+    falling back to Django's default. Django's must_update() compares stored hashes against
+    these values, so changing a parameter makes each user's hash upgrade on their next login.
+    """
+    def __init__(self, default):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        params = getattr(settings, 'PASSWORD_HASHER_PARAMS', {}).get(owner.profile, {})
+        return params.get(self.name, self.default)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    profile = 'pbkdf2'
+    iterations = TunedParameter(PBKDF2PasswordHasher.iterations)
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    profile = 'scrypt'
+    work_factor = TunedParameter(ScryptPasswordHasher.work_factor)
+    block_size = TunedParameter(ScryptPasswordHasher.block_size)
+    parallelism = TunedParameter(ScryptPasswordHasher.parallelism)
+    # Only a cap: OpenSSL's default (32 MiB) would reject any work factor above 2**14,
+    # including ones from hashes made before the parameters were lowered.
+    maxmem = TunedParameter(512 * 1024 * 1024)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Requires the argon2-cffi package."""
+    profile = 'argon2'
+    time_cost = TunedParameter(Argon2PasswordHasher.time_cost)
+    memory_cost = TunedParameter(Argon2PasswordHasher.memory_cost)
+    parallelism = TunedParameter(Argon2PasswordHasher.parallelism)
+
+
+PROFILE_HASHERS = {
+    hasher.profile: hasher
+    for hasher in (TunedPBKDF2PasswordHasher, TunedScryptPasswordHasher, TunedArgon2PasswordHasher)
+}
@@ -0,0 +1,352 @@
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.authtoken.models import Token
+
+from rating.models import FavoriteRecipe, RecipeRating
+from users.models import CustomUser, DietaryPreference
+
+Recipe = RecipeRating._meta.get_field('recipe').related_model
+
+PASSWORD = 'benchmark-password'
+TAGS = ['vegetarian', 'vegan', 'gluten-free', 'dairy-free', 'halal', 'kosher', 'keto', 'peanut-allergy']
+
+
+def _auth(ctx, user):
+    return {'HTTP_AUTHORIZATION': f"Token {ctx['tokens'][user]}"}
+
+
+def _login(client, ctx, rng):
+    user = rng.choice(ctx['users'])
+    return client.post('/api/users/login/', {'username': user, 'password': PASSWORD}, content_type='application/json')
+
+
+def _profile(client, ctx, rng):
+    return client.get('/api/users/profile/', **_auth(ctx, rng.choice(ctx['users'])))
+
+
+def _preferences(client, ctx, rng):
+    return client.get('/api/users/preferences/', **_auth(ctx, rng.choice(ctx['users'])))
+
+
+def _bootstrap(client, ctx, rng):
+    return client.get('/api/users/bootstrap/', **_auth(ctx, rng.choice(ctx['users'])))
+
+
+def _favorites(client, ctx, rng):
+    return client.get('/api/rating/favorites/', **_auth(ctx, rng.choice(ctx['users'])))
+
+
+def _ratings(client, ctx, rng):
+    recipe_id = rng.choice(ctx['recipes'])
+    return client.get(f'/api/rating/ratings/?recipe_id={recipe_id}', **_auth(ctx, rng.choice(ctx['users'])))
+
+
+def _rate(client, ctx, rng):
+    payload = {'recipe': rng.choice(ctx['recipes']), 'rating': rng.randint(1, 5)}
+    return client.post('/api/rating/ratings/', payload, content_type='application/json', **_auth(ctx, rng.choice(ctx['users'])))
+
+
+def _rating_summary(client, ctx, rng):
+    recipe_id = rng.choice(ctx['recipes'])
+    return client.get(f'/api/rating/ratings/summary/{recipe_id}/', **_auth(ctx, rng.choice(ctx['users'])))
+
+
+def _leaderboard(client, ctx, rng):
+    params = {'kind': rng.choice(['top_rated', 'most_favorited']), 'window': rng.choice(['7d', '30d', 'all'])}
+    return client.get('/api/rating/leaderboard/', params, **_auth(ctx, rng.choice(ctx['users'])))
+
+
+SCENARIOS = {
+    'login': _login,
+    'profile': _profile,
+    'preferences': _preferences,
+    'bootstrap': _bootstrap,
+    'favorites': _favorites,
+    'ratings': _ratings,
+    'rate': _rate,
+    'rating_summary': _rating_summary,
+    'leaderboard': _leaderboard,
+}
+
+
+# Routes with an async-native variant, which --mode asgi benchmarks instead of the sync view
+ASYNC_ROUTES = {
+    '/api/users/profile/': '/api/users/async/profile/',
+    '/api/rating/favorites/': '/api/rating/async/favorites/',
+    '/api/rating/ratings/': '/api/rating/async/ratings/',
+}
+
+
+class AsgiClient:
+    """
+    AsyncClient called like the sync Client, so the scenarios serve both modes: HTTP_* keyword
+    arguments become headers, and routes with an async variant are rewritten to it.
+    """
+    def __init__(self):
+        self._client = AsyncClient(raise_request_exception=False)
+
+    def _request(self, method, path, *args, **extra):
+        route, _, query = path.partition('?')
+        path = ASYNC_ROUTES.get(route, route) + (f'?{query}' if query else '')
+        headers = {key[5:].replace('_', '-'): extra.pop(key) for key in list(extra) if key.startswith('HTTP_')}
+        return getattr(self._client, method)(path, *args, headers=headers, **extra)
+
+    def get(self, path, *args, **extra):
+        return self._request('get', path, *args, **extra)
+
+    def post(self, path, *args, **extra):
+        return self._request('post', path, *args, **extra)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, wall_time):
+    """Latency percentiles (ms), throughput and queries/request for one scenario's samples."""
+    latencies = sorted(sample['latency'] * 1000 for sample in samples)
+    errors = sum(1 for sample in samples if sample['status'] >= 400)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'requests_per_sec': round(len(samples) / wall_time, 1) if wall_time else None,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'queries_per_request': round(statistics.fmean(sample['queries'] for sample in samples), 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with users, ratings and favorites, drive the API "
+        "endpoints concurrently through Django's test client and report latency percentiles, "
+        "throughput and queries per request, through the sync (WSGI) and/or async (ASGI) "
+        "request paths. Runs offline against the configured database engine (SQLite or a "
+        "local Postgres); the real database is never touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ratings-per-user', type=int, default=20)
+        parser.add_argument('--favorites-per-user', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=500, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent client threads.")
+        parser.add_argument(
+            '--scenarios', default=','.join(SCENARIOS),
+            help=f"Comma-separated scenarios to run (default: all of {', '.join(SCENARIOS)}).",
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for data and request mix.")
+        parser.add_argument('--json', dest='json_path', help="Also write the results as JSON to this file.")
+        parser.add_argument(
+            '--mode', choices=['wsgi', 'asgi', 'both'], default='wsgi',
+            help="wsgi: sync test client, one thread per concurrent client. asgi: AsyncClient "
+                 "on one event loop, with the async view variants where they exist. both: each "
+                 "scenario in both modes.",
+        )
+        parser.add_argument(
+            '--throttle', action='store_true',
+            help="Keep LOGIN_THROTTLE on (off by default: every benchmark client shares one IP).",
+        )
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        setup_test_environment()
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST'].get('NAME'):
+            # The default in-memory test database takes table locks on concurrent writes; a
+            # temporary file behaves like the real database (busy timeout, journal mode)
+            handle, path = tempfile.mkstemp(prefix='benchmark-', suffix='.sqlite3')
+            os.close(handle)
+            connection.settings_dict['TEST']['NAME'] = path
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        throttle = override_settings(LOGIN_THROTTLE={**getattr(settings, 'LOGIN_THROTTLE', {}), 'ENABLED': options['throttle']})
+        throttle.enable()
+        try:
+            ctx = self.seed(options)
+            results = {}
+            modes = ['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]
+            for name in scenarios:
+                for mode in modes:
+                    key = name if mode == 'wsgi' else f'{name}:asgi'
+                    run = self.run_scenario if mode == 'wsgi' else self.run_scenario_asgi
+                    results[key] = run(name, ctx, options)
+                    self.report(key, results[key])
+        finally:
+            throttle.disable()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump({'meta': self.meta(options), 'results': results}, fh, indent=2)
+            self.stdout.write(f"Wrote {options['json_path']}")
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        password = make_password(PASSWORD) # Hash once; every seeded user shares it
+
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench{i}', email=f'bench{i}@example.com', password=password)
+            for i in range(options['users'])
+        ], batch_size=1000)
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(title=f'Benchmark recipe {i}') for i in range(options['recipes'])], batch_size=1000,
+        )
+        tokens = Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users], batch_size=1000)
+
+        ratings, favorites = [], []
+        for user in users:
+            for recipe in rng.sample(recipes, min(options['ratings_per_user'], len(recipes))):
+                ratings.append(RecipeRating(user=user, recipe=recipe, rating=rng.randint(1, 5)))
+            for recipe in rng.sample(recipes, min(options['favorites_per_user'], len(recipes))):
+                favorites.append(FavoriteRecipe(user=user, recipe=recipe))
+        RecipeRating.objects.bulk_create(ratings, batch_size=1000)
+        FavoriteRecipe.objects.bulk_create(favorites, batch_size=1000)
+        call_command('rebuild_rating_summaries', stdout=StringIO())
+        call_command('refresh_leaderboards', '--rebuild-activity', stdout=StringIO())
+
+        for user in users[:len(users) // 2]:
+            DietaryPreference.objects.create(user=user).set_tags(rng.sample(TAGS, 2))
+
+        self.stdout.write(
+            f"Seeded {len(users)} users, {len(recipes)} recipes, {len(ratings)} ratings, "
+            f"{len(favorites)} favorites in {time.perf_counter() - started:.1f}s"
+        )
+        return {
+            'users': [user.username for user in users],
+            'tokens': {token.user.username: token.key for token in tokens},
+            'recipes': [recipe.pk for recipe in recipes],
+        }
+
+    def run_scenario(self, name, ctx, options):
+        scenario = SCENARIOS[name]
+        remaining = itertools.islice(itertools.count(), options['requests'])
+        lock = threading.Lock()
+
+        def worker(worker_index):
+            # Each worker thread owns its client and database connection, closed when done
+            client = Client(raise_request_exception=False) # Failures are counted, not raised
+            rng = random.Random(f"{options['seed']}-{name}-{worker_index}")
+            queries = 0
+
+            def count(execute, sql, params, many, context):
+                nonlocal queries
+                queries += 1
+                return execute(sql, params, many, context)
+
+            samples = []
+            try:
+                with connection.execute_wrapper(count):
+                    while True:
+                        with lock:
+                            if next(remaining, None) is None:
+                                break
+                        queries = 0
+                        started = time.perf_counter()
+                        response = scenario(client, ctx, rng)
+                        latency = time.perf_counter() - started
+                        samples.append({'latency': latency, 'status': response.status_code, 'queries': queries})
+            finally:
+                connections.close_all()
+            return samples
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            per_worker = list(pool.map(worker, range(options['concurrency'])))
+        wall_time = time.perf_counter() - started
+        return summarize([sample for samples in per_worker for sample in samples], wall_time)
+
+    def run_scenario_asgi(self, name, ctx, options):
+        scenario = SCENARIOS[name]
+        remaining = itertools.islice(itertools.count(), options['requests'])
+
+        async def worker(worker_index):
+            # An ASGI server gives each request a context whose sync work (sync views, ORM
+            # calls) runs on one thread; here each concurrent client gets one, so workers
+            # hold a database connection each, as in the wsgi mode
+            async with ThreadSensitiveContext():
+                client = AsgiClient()
+                rng = random.Random(f"{options['seed']}-{name}-{worker_index}")
+                queries = 0
+
+                def count(execute, sql, params, many, context):
+                    nonlocal queries
+                    queries += 1
+                    return execute(sql, params, many, context)
+
+                # Connections are per thread: install the counter on the context's thread
+                await sync_to_async(lambda: connection.execute_wrappers.append(count))()
+                samples = []
+                try:
+                    while next(remaining, None) is not None: # One event loop, no lock needed
+                        queries = 0
+                        started = time.perf_counter()
+                        response = await scenario(client, ctx, rng)
+                        latency = time.perf_counter() - started
+                        samples.append({'latency': latency, 'status': response.status_code, 'queries': queries})
+                finally:
+                    await sync_to_async(connections.close_all)()
+                return samples
+
+        async def run():
+            return await asyncio.gather(*(worker(index) for index in range(options['concurrency'])))
+
+        started = time.perf_counter()
+        per_worker = asyncio.run(run())
+        wall_time = time.perf_counter() - started
+        return summarize([sample for samples in per_worker for sample in samples], wall_time)
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<20} {result['requests']:>6} req {result['errors']:>4} err "
+            f"{result['requests_per_sec']:>8} req/s  p50 {result['p50_ms']:>7} ms  "
+            f"p95 {result['p95_ms']:>7} ms  p99 {result['p99_ms']:>7} ms  "
+            f"{result['queries_per_request']:>5} queries/req"
+        )
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'database': connection.vendor,
+            'password_hasher': settings.PASSWORD_HASHERS[0],
+            'login_throttle': options['throttle'],
+            'mode': options['mode'],
+            'options': {key: options[key] for key in (
+                'users', 'recipes', 'ratings_per_user', 'favorites_per_user', 'requests', 'concurrency', 'seed',
+            )},
+        }
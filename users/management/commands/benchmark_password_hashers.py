@@ -0,0 +1,64 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from users.hashers import PROFILE_HASHERS
+
+
+def _setup_worker():
+    # Needed when worker processes are spawned rather than forked
+    django.setup()
+
+
+def _hash_for(profile, seconds):
+    """Hash passwords with `profile` for `seconds` in this process; returns the count."""
+    hasher = PROFILE_HASHERS[profile]()
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        hasher.encode('benchmark-password', hasher.salt())
+        count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = "Measure password hashes/sec per hasher profile (see PASSWORD_HASHER_PARAMS), per core and in total."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles', default=','.join(PROFILE_HASHERS),
+            help="Comma-separated profiles to benchmark (default: all).",
+        )
+        parser.add_argument('--seconds', type=float, default=3.0, help="Duration of each run.")
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help="Parallel worker processes, normally one per core (default: all cores).",
+        )
+
+    def handle(self, *args, **options):
+        profiles = [profile.strip() for profile in options['profiles'].split(',') if profile.strip()]
+        unknown = set(profiles) - set(PROFILE_HASHERS)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+        processes, seconds = options['processes'], options['seconds']
+
+        self.stdout.write(f"{'profile':<8} {'parameters':<50} {'per core/s':>11} {'total/s':>9} {'ms/hash':>8}")
+        with ProcessPoolExecutor(max_workers=processes, initializer=_setup_worker) as pool:
+            for profile in profiles:
+                hasher = PROFILE_HASHERS[profile]()
+                try:
+                    hasher.encode('warm-up', hasher.salt())
+                except ValueError as exc: # e.g. argon2-cffi isn't installed
+                    self.stderr.write(f"{profile:<8} skipped: {exc}")
+                    continue
+                counts = list(pool.map(_hash_for, [profile] * processes, [seconds] * processes))
+                total = sum(counts) / seconds
+                per_core = total / processes
+                parameters = ', '.join(f'{key}={value}' for key, value in sorted(hasher.safe_summary(
+                    hasher.encode('x', hasher.salt())).items()) if key not in ('salt', 'hash', 'algorithm'))
+                self.stdout.write(
+                    f"{profile:<8} {parameters:<50} {per_core:>11.1f} {total:>9.1f} {1000 / per_core:>8.1f}"
+                )
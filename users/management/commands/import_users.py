@@ -0,0 +1,249 @@
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from users.models import CustomUser, DietaryPreference, DietaryTag, normalize_dietary_tags
+
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name', 'region')
+
+
+def _setup_worker():
+    # Needed when worker processes are spawned rather than forked
+    django.setup()
+
+
+def _hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a CSV stream with a header row, or an NDJSON stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield number, ValueError(f'Invalid JSON: {exc}')
+                continue
+            yield number, row if isinstance(row, dict) else ValueError('Expected a JSON object.')
+
+
+class Candidate:
+    """A validated input row waiting for its password hash."""
+    def __init__(self, line, user, password, tags):
+        self.line = line
+        self.user = user
+        self.password = password # Plaintext to hash, or None when the row brought a hash
+        self.tags = tags
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users (and their dietary preferences) from a CSV or NDJSON file, hashing "
+        "passwords across a process pool and inserting in batches. Columns: username, email, "
+        "password or password_hash, first_name, last_name, region, dietary_preferences "
+        "(a list, or a string separated by ';' or ','). Rows that fail validation are reported "
+        "and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument('--format', dest='fmt', choices=['csv', 'ndjson'], help="Default: from the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help="Password hashing worker processes (default: all cores).",
+        )
+        parser.add_argument('--errors', help="Write the rejected rows (line, username, error) to this CSV file.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate only; hash and insert nothing.")
+
+    def handle(self, *args, **options):
+        path, fmt = options['path'], options['fmt']
+        if fmt is None:
+            fmt = 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv' if path.endswith('.csv') else None
+            if fmt is None:
+                raise CommandError("Can't tell the format from the file name; pass --format.")
+
+        self.errors = []
+        self.seen_usernames, self.seen_emails = set(), set()
+        self.tag_ids = {}
+        self.hashed = 0
+        read = created = valid = 0
+        started = time.perf_counter()
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        rows = read_rows(stream, fmt)
+        batches = iter(lambda: list(islice(rows, options['batch_size'])), [])
+        try:
+            with ProcessPoolExecutor(max_workers=options['processes'], initializer=_setup_worker) as pool:
+                # Pipelined: the pool hashes batch N while batch N-1 is inserted
+                pending = None
+                for batch in batches:
+                    read += len(batch)
+                    candidates = self.validate(batch)
+                    valid += len(candidates)
+                    if options['dry_run']:
+                        continue
+                    hashes = self.hash(pool, candidates, options['processes'])
+                    if pending is not None:
+                        created += self.insert(*pending)
+                    pending = (candidates, hashes)
+                if pending is not None:
+                    created += self.insert(*pending)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        if options['errors'] and self.errors:
+            with open(options['errors'], 'w', newline='') as fh:
+                writer = csv.writer(fh)
+                writer.writerow(['line', 'username', 'error'])
+                writer.writerows(sorted(self.errors))
+        for line, username, error in sorted(self.errors)[:20]:
+            self.stderr.write(f"line {line} ({username or '?'}): {error}")
+        if len(self.errors) > 20:
+            self.stderr.write(f"... and {len(self.errors) - 20} more rejected rows")
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        count = valid if options['dry_run'] else created
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {count} users, rejected {len(self.errors)}, in {elapsed:.1f}s "
+            f"({read / elapsed if elapsed else 0:.0f} rows/s, {self.hashed / elapsed if elapsed else 0:.1f} password hashes/s)."
+        ))
+
+    def validate(self, batch):
+        """Check a batch like UserRegistrationSerializer would; returns the valid Candidates."""
+        candidates = []
+        for line, row in batch:
+            if isinstance(row, Exception):
+                self.errors.append((line, '', str(row)))
+                continue
+            try:
+                candidates.append(self.clean(line, row))
+            except ValueError as exc:
+                self.errors.append((line, row.get('username', ''), str(exc)))
+        if not candidates:
+            return []
+
+        # One query each for usernames and emails already taken
+        taken_usernames = set(CustomUser.objects.filter(
+            username__in=[candidate.user.username for candidate in candidates],
+        ).values_list('username', flat=True))
+        taken_emails = {email.lower() for email in CustomUser.objects.filter_by_emails(
+            [candidate.user.email for candidate in candidates if candidate.user.email],
+        ).values_list('email', flat=True)}
+
+        valid = []
+        for candidate in candidates:
+            username, email = candidate.user.username, candidate.user.email.lower()
+            if username in taken_usernames or username in self.seen_usernames:
+                self.errors.append((candidate.line, username, 'This username is already in use.'))
+            elif email and (email in taken_emails or email in self.seen_emails):
+                self.errors.append((candidate.line, username, 'This email is already in use.'))
+            else:
+                self.seen_usernames.add(username)
+                if email:
+                    self.seen_emails.add(email)
+                valid.append(candidate)
+        return valid
+
+    def clean(self, line, row):
+        values = {field: (row.get(field) or '').strip() for field in USER_FIELDS}
+        if not values['username']:
+            raise ValueError('A username is required.')
+        if not values['region']:
+            del values['region'] # Model default
+        user = CustomUser(**values)
+        try:
+            user.full_clean(exclude=['password'], validate_unique=False, validate_constraints=False)
+        except ValidationError as exc:
+            raise ValueError('; '.join(f'{field}: {" ".join(messages)}' for field, messages in exc.message_dict.items()))
+
+        password, password_hash = row.get('password'), row.get('password_hash')
+        if password_hash:
+            try:
+                identify_hasher(password_hash)
+            except ValueError:
+                raise ValueError('password_hash is not a hash this project can verify.')
+            user.password, password = password_hash, None
+        elif password:
+            if len(password) < 8:
+                raise ValueError('Password must be at least 8 characters long.')
+        else:
+            password = None
+            user.set_unusable_password() # e.g. accounts that will only sign in with Google
+
+        tags = row.get('dietary_preferences') or []
+        if isinstance(tags, str):
+            tags = tags.replace(';', ',').split(',')
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            raise ValueError('dietary_preferences: expected a list of strings or a comma-separated string.')
+        return Candidate(line, user, password, normalize_dietary_tags(tags))
+
+    def hash(self, pool, candidates, processes):
+        """Start hashing the batch's passwords across the pool; returns a lazy iterator of hashes."""
+        passwords = [candidate.password for candidate in candidates if candidate.password is not None]
+        self.hashed += len(passwords)
+        size = max(1, -(-len(passwords) // (processes * 4))) # A few chunks per worker
+        chunks = [passwords[start:start + size] for start in range(0, len(passwords), size)]
+        return pool.map(_hash_passwords, chunks)
+
+    def insert(self, candidates, hashes):
+        if not candidates:
+            return 0
+        hashes = iter([password for chunk in hashes for password in chunk])
+        for candidate in candidates:
+            if candidate.password is not None:
+                candidate.user.password = next(hashes)
+        try:
+            with transaction.atomic():
+                CustomUser.objects.bulk_create([candidate.user for candidate in candidates])
+                self.insert_preferences(candidates)
+            return len(candidates)
+        except IntegrityError:
+            pass
+
+        # Someone registered one of these usernames/emails meanwhile: retry row by row to find it
+        created = 0
+        for candidate in candidates:
+            candidate.user.pk = None
+            try:
+                with transaction.atomic():
+                    CustomUser.objects.bulk_create([candidate.user])
+                    self.insert_preferences([candidate])
+                created += 1
+            except IntegrityError as exc:
+                self.errors.append((candidate.line, candidate.user.username, f'Conflict while inserting: {exc}'))
+        return created
+
+    def insert_preferences(self, candidates):
+        tagged = [candidate for candidate in candidates if candidate.tags]
+        if not tagged:
+            return
+        missing = {tag for candidate in tagged for tag in candidate.tags} - self.tag_ids.keys()
+        if missing:
+            DietaryTag.objects.bulk_create([DietaryTag(name=name) for name in missing], ignore_conflicts=True)
+            self.tag_ids.update(DietaryTag.objects.filter(name__in=missing).values_list('name', 'id'))
+        preferences = DietaryPreference.objects.bulk_create([DietaryPreference(user=candidate.user) for candidate in tagged])
+        through = DietaryPreference.tags.through
+        through.objects.bulk_create([
+            through(dietarypreference_id=preference.pk, dietarytag_id=self.tag_ids[tag])
+            for preference, candidate in zip(preferences, tagged)
+            for tag in candidate.tags
+        ])
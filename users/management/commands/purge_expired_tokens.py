@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.tokens import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete auth tokens older than AUTH_TOKEN_TTL. Meant to be run periodically (cron, systemd timer, ...)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Tokens deleted per statement.")
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_tokens(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired tokens."))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_customuser_email_ci_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DietaryTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text="Normalized (stripped, lowercase) tag, e.g. 'gluten-free'", max_length=50, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='dietarypreference',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='preferences', to='users.dietarytag'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+def copy_preferences_to_tags(apps, schema_editor):
+    DietaryPreference = apps.get_model('users', 'DietaryPreference')
+    DietaryTag = apps.get_model('users', 'DietaryTag')
+    Through = DietaryPreference.tags.through
+
+    tag_names_by_preference = {}
+    for pk, preferences in DietaryPreference.objects.values_list('pk', 'preferences').iterator(chunk_size=2000):
+        names = {name.strip().lower() for name in preferences.split(',')}
+        names.discard('')
+        if names:
+            tag_names_by_preference[pk] = names
+
+    all_names = set().union(*tag_names_by_preference.values())
+    DietaryTag.objects.bulk_create([DietaryTag(name=name) for name in all_names], ignore_conflicts=True)
+    tag_ids = dict(DietaryTag.objects.values_list('name', 'pk'))
+    Through.objects.bulk_create(
+        [
+            Through(dietarypreference_id=pk, dietarytag_id=tag_ids[name])
+            for pk, names in tag_names_by_preference.items()
+            for name in names
+        ],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+
+def copy_tags_to_preferences(apps, schema_editor):
+    DietaryPreference = apps.get_model('users', 'DietaryPreference')
+    preferences = list(DietaryPreference.objects.prefetch_related('tags'))
+    for preference in preferences:
+        preference.preferences = ','.join(tag.name for tag in preference.tags.all())
+    DietaryPreference.objects.bulk_update(preferences, ['preferences'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_dietarytag'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_preferences_to_tags, copy_tags_to_preferences),
+    ]
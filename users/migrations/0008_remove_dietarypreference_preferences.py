@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:46
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_copy_dietary_preferences_to_tags'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='dietarypreference',
+            name='preferences',
+        ),
+    ]
@@ -1,7 +1,17 @@
 # users/models.py
 
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Lower
+from django.contrib.auth.models import AbstractUser, UserManager
+
+class CustomUserManager(UserManager):
+    def filter_by_email(self, email):
+        """Case-insensitive email lookup that can use the unique index on lower(email)."""
+        return self.alias(email_lower=Lower('email')).filter(email_lower=email.lower()).exclude(email='')
+
+    def filter_by_emails(self, emails):
+        """Same for many emails at once."""
+        return self.alias(email_lower=Lower('email')).filter(email_lower__in=[email.lower() for email in emails]).exclude(email='')
 
 class CustomUser(AbstractUser):
     USER = 'user'
@@ -16,12 +26,90 @@ class CustomUser(AbstractUser):
     is_verified_contributor = models.BooleanField(default=False)
     region = models.CharField(max_length=10, default='global', help_text="User's region for ingredient localization.")
 
+    objects = CustomUserManager()
+
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # Emails are unique regardless of case; blank emails (allowed by AbstractUser) are exempt.
+            # Also serves as the functional index for email logins.
+            models.UniqueConstraint(
+                Lower('email'),
+                condition=~models.Q(email=''),
+                name='users_customuser_email_ci_unique',
+            ),
+        ]
+
     def __str__(self):
         return self.username
 
+def normalize_dietary_tag(name):
+    return name.strip().lower()
+
+def normalize_dietary_tags(names):
+    """
+    Normalized tag names without blanks or duplicates. Raises ValueError for a name longer
+    than DietaryTag.name holds, which the database would otherwise reject mid-write.
+    """
+    names = list(dict.fromkeys(name for name in map(normalize_dietary_tag, names) if name))
+    max_length = DietaryTag._meta.get_field('name').max_length
+    too_long = [name for name in names if len(name) > max_length]
+    if too_long:
+        raise ValueError(f"Dietary tags can be at most {max_length} characters long: {', '.join(too_long)}")
+    return names
+
+class DietaryTag(models.Model):
+    name = models.CharField(max_length=50, unique=True, help_text="Normalized (stripped, lowercase) tag, e.g. 'gluten-free'")
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+class DietaryPreferenceManager(models.Manager):
+    def get_or_create_for(self, user):
+        """
+        `user`'s preferences, created empty if they have none yet. The insert runs in a
+        savepoint and falls back to the existing row on a unique violation, so concurrent
+        first writes can't fail. Returns (preference, created).
+        """
+        preference = self.filter(user=user).first()
+        if preference is not None:
+            return preference, False
+        try:
+            with transaction.atomic():
+                return self.create(user=user), True
+        except IntegrityError:
+            preference = self.filter(user=user).first()
+            if preference is None:
+                raise
+            return preference, False
+
 class DietaryPreference(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='dietary_preferences')
-    preferences = models.TextField(blank=True, default="", help_text="Comma-separated dietary preferences, e.g. 'vegetarian,gluten-free,peanut-allergy'")
+    tags = models.ManyToManyField(DietaryTag, blank=True, related_name='preferences')
+
+    objects = DietaryPreferenceManager()
 
     def __str__(self):
-        return f"Preferences for {self.user.username}"
\ No newline at end of file
+        return f"Preferences for {self.user.username}"
+
+    @property
+    def tag_names(self):
+        # Served from prefetch_related('tags') when the caller used it
+        return [tag.name for tag in self.tags.all()]
+
+    @property
+    def preferences(self):
+        """Comma-separated tag names, as the text field these tags replaced stored them."""
+        return ','.join(self.tag_names)
+
+    def set_tags(self, names):
+        """Replace the tags with `names`, normalizing them and creating any unknown tag."""
+        names = normalize_dietary_tags(names)
+        tags = DietaryTag.objects.in_bulk(names, field_name='name')
+        missing = [DietaryTag(name=name) for name in names if name not in tags]
+        if missing:
+            DietaryTag.objects.bulk_create(missing, ignore_conflicts=True)
+            tags = DietaryTag.objects.in_bulk(names, field_name='name')
+        self.tags.set(tags.values())
\ No newline at end of file
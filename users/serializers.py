@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
-from .models import CustomUser, DietaryPreference  # Import your CustomUser model
+from .models import CustomUser, DietaryPreference, DietaryTag, normalize_dietary_tags  # Import your CustomUser model
 from django.contrib.auth import authenticate #used for authenticating username/password
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -10,6 +10,12 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         model = CustomUser
         fields = ('username', 'email', 'password', 'first_name', 'last_name')  # Fields required for registration
 
+    def validate_email(self, value):
+        # Emails are unique regardless of case (see CustomUser.Meta.constraints)
+        if value and CustomUser.objects.filter_by_email(value).exists():
+            raise serializers.ValidationError("This email is already in use.")
+        return value
+
     def validate_password(self, value):
         # Basic password validation (you can add more complexity)
         if len(value) < 8:
@@ -36,30 +42,8 @@ class UserLoginSerializer(serializers.Serializer):
         if not password:
             raise serializers.ValidationError("Password is required.")
 
-        user = None
-        if username:
-            # Authenticate by username
-            user = authenticate(username=username, password=password)
-        elif email:
-            # Authenticate by email
-            try:
-                # Find user by email, then try to authenticate with their username
-                # This assumes username is unique, or you want to allow email login
-                # by finding the user and then authenticating with their username
-                # which is what authenticate() expects.
-                # A more robust email login might involve a custom authentication backend.
-                 # For simplicity, let's assume username is also email if logging in via email for now,
-                # or that a user object can be retrieved by email and then authenticated.
-                # A common pattern is to fetch the user by email, then pass their username to authenticate().
-
-                # More robust email login:
-                # Try to find a user with the given email first
-                temp_user = CustomUser.objects.get(email=email)
-                user = authenticate(username=temp_user.username, password=password)
-
-            except CustomUser.DoesNotExist:
-                raise serializers.ValidationError("Invalid credentials.")
-
+        # UsernameOrEmailBackend resolves either identifier in a single query
+        user = authenticate(request=self.context.get('request'), username=username or email, password=password)
 
         if not user:
             raise serializers.ValidationError("Invalid credentials.")
@@ -93,8 +77,8 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
 
     def validate_email(self, value):
         # Allow email to be blank or the user's current email
-        if value and value != self.instance.email:
-            if CustomUser.objects.filter(email=value).exists():
+        if value and value.lower() != self.instance.email.lower():
+            if CustomUser.objects.filter_by_email(value).exists():
                 raise serializers.ValidationError("This email is already in use.")
         return value
     
@@ -106,25 +90,39 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
     
+class DietaryTagListField(serializers.Field):
+    """Tag names as a list; a comma-separated string is accepted on input too."""
+    default_error_messages = {
+        'invalid': 'Expected a list of strings or a comma-separated string.',
+        'max_length': 'Ensure each tag has no more than {max_length} characters.',
+    }
+
+    def to_representation(self, tags):
+        return [tag.name for tag in tags.all()]
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = data.split(',')
+        if not isinstance(data, list) or not all(isinstance(name, str) for name in data):
+            self.fail('invalid')
+        try:
+            normalize_dietary_tags(data)
+        except ValueError:
+            self.fail('max_length', max_length=DietaryTag._meta.get_field('name').max_length)
+        return data
+
 class DietaryPreferenceSerializer(serializers.ModelSerializer):
+    preferences = DietaryTagListField(source='tags', required=False)
+
     class Meta:
         model = DietaryPreference
-        fields = ['preferences'] # Only exposing the 'preferences' field
-
-    def to_representation(self, instance):
-        # Convert the comma-separated string back to a list for output
-        data = super().to_representation(instance)
-        if data['preferences']:
-            data['preferences'] = [p.strip() for p in data['preferences'].split(',')]
-        else:
-            data['preferences'] = []
-        return data
+        fields = ['preferences'] # Only exposing the preference tags, as a list of names
 
-    def to_internal_value(self, data):
-        # Convert a list of preferences from input back to a comma-separated string
-        if 'preferences' in data and isinstance(data['preferences'], list):
-            data['preferences'] = ','.join(data['preferences'])
-        return super().to_internal_value(data)
+    def update(self, instance, validated_data):
+        # Tags are normalized and created on the fly; see DietaryPreference.set_tags
+        if 'tags' in validated_data:
+            instance.set_tags(validated_data['tags'])
+        return instance
     
 # Add this to your users/serializers.py file
 
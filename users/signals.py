@@ -0,0 +1,33 @@
+# users/signals.py
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user_tokens
+from .caching import bump_payload_version
+from .models import CustomUser, DietaryPreference
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Cached tokens carry a copy of the user; drop them whenever the user row changes
+    invalidate_user_tokens(instance.pk)
+    bump_payload_version(instance.pk)
+
+
+@receiver(post_delete, sender=DietaryPreference)
+def invalidate_deleted_preferences(sender, instance, **kwargs):
+    bump_payload_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=DietaryPreference.tags.through)
+def invalidate_changed_preferences(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse: # Changed from the DietaryTag side
+        user_ids = DietaryPreference.objects.filter(pk__in=kwargs['pk_set'] or ()).values_list('user_id', flat=True)
+    else:
+        user_ids = [instance.user_id]
+    for user_id in user_ids:
+        bump_payload_version(user_id)
@@ -1,3 +1,397 @@
-from django.test import TestCase
+import csv
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Avg
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from meal_project.async_views import select_view
+from meal_project.testing import SHARED_TEST_CACHES, SHARED_TOKEN_AUTH_CACHE, QueryBudgetMixin
+from rating.models import FavoriteRecipe, RecipeRating
+
+from .authentication import _load_cached_token, _token_cache_key, get_token_cache, invalidate_user_tokens
+from .caching import bump_payload_version
+from .checks import check_payload_cache, check_token_cache
+from .google import reset_clients
+from .hashers import TunedPBKDF2PasswordHasher
+from .models import CustomUser, DietaryPreference
+from .throttling import TokenBucketThrottle
+from .views import AsyncUserProfileView, UserProfileView, google_login
+
+Recipe = RecipeRating._meta.get_field('recipe').related_model
+
+USERS = 500
+TAGS = ['vegetarian', 'vegan', 'gluten-free', 'dairy-free', 'halal', 'kosher', 'keto', 'peanut-allergy']
+PASSWORD = 'correct-horse-battery'
+
+
+def google_stub_transport():
+    """Stands in for Google's userinfo endpoint (GOOGLE_USERINFO['TRANSPORT'])."""
+    def handler(request):
+        if request.headers['Authorization'].startswith('Bearer valid-'):
+            return httpx.Response(200, json={'email': 'user0@example.com', 'given_name': 'Ada', 'family_name': 'Lovelace'})
+        return httpx.Response(401, json={'error': 'invalid_token'})
+    return httpx.MockTransport(handler)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    GOOGLE_USERINFO={'TRANSPORT': 'users.tests.google_stub_transport'},
+    CACHES=SHARED_TEST_CACHES,
+    TOKEN_AUTH_CACHE=SHARED_TOKEN_AUTH_CACHE,
+    USER_PAYLOAD_CACHE_ALIAS='shared',
+)
+class UsersQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every route in users/urls.py, against a few hundred users with preferences."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [CustomUser(username=f'user{i}', email=f'user{i}@example.com') for i in range(USERS)]
+        for user in users:
+            user.set_password(PASSWORD)
+        CustomUser.objects.bulk_create(users)
+        cls.user = CustomUser.objects.get(username='user0')
+        cls.admin = CustomUser.objects.create_user('admin', 'admin@example.com', PASSWORD, role='admin')
+        cls.contributor = CustomUser.objects.get(username='user1')
+        for i, user in enumerate(CustomUser.objects.filter(username__startswith='user')[:100]):
+            preference = DietaryPreference.objects.create(user=user)
+            preference.set_tags(TAGS[i % len(TAGS):][:3])
+
+        recipes = Recipe.objects.bulk_create([Recipe(title=f'Recipe {i}') for i in range(40)])
+        RecipeRating.objects.bulk_rate(cls.user, {recipe.pk: recipe.pk % 5 + 1 for recipe in recipes})
+        FavoriteRecipe.objects.bulk_add(cls.user, [recipe.pk for recipe in recipes[:25]])
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_register(self):
+        payload = {'username': 'newcomer', 'email': 'newcomer@example.com', 'password': PASSWORD}
+        with self.assertMaxQueries(3):
+            response = APIClient().post(reverse('user-registration'), payload, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_login_with_username(self):
+        with self.assertMaxQueries(2):
+            response = APIClient().post(reverse('user-login'), {'username': 'user0', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertMaxResponseSize(response, 512)
+
+    @override_settings(LOGIN_THROTTLE={'RATES': {'ip': '100/min', 'account': '2/min'}})
+    def test_login_throttled(self):
+        client = APIClient()
+        for _ in range(2):
+            response = client.post(reverse('user-login'), {'username': 'user0', 'password': 'wrong-password'}, format='json')
+            self.assertEqual(response.status_code, 400)
+        # Rejected before the user is looked up or any password hashed, whichever identifier is used
+        with self.assertMaxQueries(0):
+            response = client.post(reverse('user-login'), {'username': 'USER0', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        # Other accounts are unaffected
+        response = client.post(reverse('user-login'), {'username': 'user1', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_incomplete_throttle_is_refused(self):
+        # Caught when the class is defined, not as a 500 on the first login
+        with self.assertRaises(ImproperlyConfigured):
+            class NoKeyThrottle(TokenBucketThrottle):
+                scope = 'ip'
+
+    @override_settings(PASSWORD_HASHERS=['users.hashers.TunedPBKDF2PasswordHasher'], PASSWORD_HASHER_PARAMS={'pbkdf2': {'iterations': 1000}})
+    def test_login_upgrades_password_hash(self):
+        hasher = TunedPBKDF2PasswordHasher()
+        CustomUser.objects.filter(pk=self.user.pk).update(password=hasher.encode(PASSWORD, hasher.salt(), iterations=500))
+        self.client.get(reverse('user-profile')) # Cache the token of a signed-in client
+        response = APIClient().post(reverse('user-login'), {'username': 'user0', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        algorithm, iterations = self.user.password.split('$')[:2]
+        self.assertEqual((algorithm, int(iterations)), ('pbkdf2_sha256', 1000))
+        self.assertTrue(self.user.check_password(PASSWORD))
+        # The rehash saves the user, which drops cached tokens but revokes none
+        self.assertEqual(response.data['token'], self.token.key)
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 200)
+
+    def test_login_with_email(self):
+        with self.assertMaxQueries(2):
+            response = APIClient().post(reverse('user-login'), {'email': 'USER0@example.com', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('user-profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertMaxResponseSize(response, 256)
+        # Warm: the token lookup and the payload are both cached
+        with self.assertMaxQueries(0):
+            response = self.client.get(reverse('user-profile'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_profile_is_built_from_the_database(self):
+        self.client.get(reverse('user-profile')) # Caches the token, with a copy of the user
+        CustomUser.objects.filter(pk=self.user.pk).update(first_name='Fresh') # Skips post_save
+        bump_payload_version(self.user.pk)
+        self.assertEqual(self.client.get(reverse('user-profile')).data['first_name'], 'Fresh')
+        self.assertEqual(self.client.get(reverse('async-user-profile')).json()['first_name'], 'Fresh')
+
+    @override_settings(USER_PAYLOAD_CACHE_ALIAS=None)
+    def test_profile_without_payload_cache(self):
+        for name in ('user-profile', 'async-user-profile'):
+            etag = self.client.get(reverse(name)).headers['ETag']
+            self.assertEqual(self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.user.first_name = name
+            self.user.save()
+            response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_process_local_payload_cache_is_refused(self):
+        self.assertEqual(check_payload_cache(None), [])
+        with self.settings(USER_PAYLOAD_CACHE_ALIAS='default'):
+            self.assertEqual([error.id for error in check_payload_cache(None)], ['users.E001'])
+
+    def test_process_local_token_cache_is_refused(self):
+        self.assertEqual(check_token_cache(None), [])
+        with self.settings(TOKEN_AUTH_CACHE={**SHARED_TOKEN_AUTH_CACHE, 'CACHE_ALIAS': 'default'}):
+            self.assertEqual([error.id for error in check_token_cache(None)], ['users.E002'])
+        with self.settings(TOKEN_AUTH_CACHE={'BACKEND': 'none'}):
+            self.assertEqual(check_token_cache(None), [])
+
+    def test_async_profile(self):
+        expected = self.client.get(reverse('user-profile'))
+        with self.assertMaxQueries(0): # Token and payload come from the caches
+            response = self.client.get(reverse('async-user-profile'))
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response.headers['ETag'], expected.headers['ETag'])
+        response = self.client.get(reverse('async-user-profile'), HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # PUT is served by the sync view
+        response = self.client.put(reverse('async-user-profile'), {'first_name': 'Ada'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('async-user-profile')).json()['first_name'], 'Ada')
+
+    def test_select_view(self):
+        with self.settings(ASYNC_VIEWS=False):
+            self.assertIs(select_view(UserProfileView, AsyncUserProfileView).view_class, UserProfileView)
+        with self.settings(ASYNC_VIEWS=True):
+            self.assertIs(select_view(UserProfileView, AsyncUserProfileView).view_class, AsyncUserProfileView)
+
+    def test_update_profile(self):
+        with self.assertMaxQueries(2):
+            response = self.client.put(reverse('user-profile'), {'first_name': 'Ada'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_verify_contributor(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with self.assertMaxQueries(2):
+            response = client.post(reverse('verify-contributor', args=[self.contributor.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_preferences(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('dietary-preferences'))
+        self.assertEqual(len(response.data['preferences']), 3)
+        self.assertMaxResponseSize(response, 256)
+        with self.assertMaxQueries(0):
+            self.client.get(reverse('dietary-preferences-user', args=[self.user.pk]))
+        self.assertEqual(self.client.get(reverse('dietary-preferences-user', args=[self.admin.pk])).status_code, 403)
+
+    def test_update_preferences(self):
+        with self.assertMaxQueries(11):
+            response = self.client.put(reverse('dietary-preferences-update', args=[self.user.pk]), {'preferences': ['vegan', 'low-sodium']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.put(reverse('dietary-preferences-update', args=[self.user.pk]), {'preferences': ['vegan', 'x' * 51]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_first_preferences_write(self):
+        DietaryPreference.objects.filter(user=self.user).delete()
+        response = self.client.put(reverse('dietary-preferences-update', args=[self.user.pk]), {'preferences': ['keto']}, format='json')
+        self.assertEqual(response.data['preferences'], ['keto'])
+        # A concurrent request creates the row between this one's lookup and its insert
+        lookups = [DietaryPreference.objects.none()]
+        lookup = DietaryPreference.objects.filter
+        with mock.patch.object(DietaryPreference.objects, 'filter', lambda **kwargs: lookups.pop() if lookups else lookup(**kwargs)):
+            preference, created = DietaryPreference.objects.get_or_create_for(self.user)
+        self.assertFalse(created)
+        self.assertEqual(preference.tag_names, ['keto'])
+
+    def test_delete_preferences(self):
+        with self.assertMaxQueries(4):
+            response = self.client.delete(reverse('dietary-preferences-delete', args=[self.user.pk]))
+        self.assertEqual(response.status_code, 204)
+
+    def test_change_password(self):
+        with self.assertMaxQueries(6):
+            response = self.client.post(reverse('change-password'), {'old_password': PASSWORD, 'new_password': 'another-horse-battery'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        with self.assertMaxQueries(2):
+            response = self.client.post(reverse('user-logout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+
+    def test_expired_token(self):
+        Token.objects.filter(pk=self.token.pk).update(created=timezone.now() - timedelta(seconds=settings.AUTH_TOKEN_TTL))
+        response = self.client.get(reverse('user-profile'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'], 'Token has expired.')
+        # Logging in replaces it
+        response = APIClient().post(reverse('user-login'), {'username': 'user0', 'password': PASSWORD}, format='json')
+        self.assertNotEqual(response.data['token'], self.token.key)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 200)
+
+    def test_purge_expired_tokens(self):
+        expired = [Token.objects.create(user=user) for user in CustomUser.objects.filter(username__in=['user1', 'user2', 'user3'])]
+        Token.objects.filter(pk__in=[token.pk for token in expired]).update(created=timezone.now() - timedelta(seconds=settings.AUTH_TOKEN_TTL + 1))
+        call_command('purge_expired_tokens', batch_size=2, stdout=StringIO())
+        self.assertEqual(list(Token.objects.values_list('key', flat=True)), [self.token.key])
+
+    def test_change_password_revokes_token(self):
+        self.client.get(reverse('user-profile')) # Cache the token
+        response = self.client.post(reverse('change-password'), {'old_password': PASSWORD, 'new_password': 'another-horse-battery'}, format='json')
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 200)
+
+    def test_token_cache_leaves_out_password(self):
+        self.client.get(reverse('user-profile')) # Cache the token
+        entry = get_token_cache().get(_token_cache_key(self.token.key))
+        self.assertNotIn(self.user.password.encode(), entry)
+        # The hash is still there for the views that need it, loaded on first access
+        _, token = _load_cached_token(Token, entry)
+        self.assertEqual(token.user.get_deferred_fields(), {'password'})
+        with self.assertMaxQueries(1):
+            self.assertTrue(token.user.check_password(PASSWORD))
+
+    def test_invalidate_user_tokens(self):
+        self.client.get(reverse('user-profile')) # Cache the token
+        Token.objects.filter(pk=self.token.pk).delete() # Without invalidating the cache
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 200)
+        invalidate_user_tokens(self.user.pk)
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+
+        # An evicted generation doesn't bring stale entries back either
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.client.get(reverse('user-profile'))
+        Token.objects.filter(pk=token.pk).delete()
+        caches['shared'].delete(f'users:token-generation:{self.user.pk}')
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+
+    @override_settings(TOKEN_AUTH_CACHE={'BACKEND': 'local', 'TIMEOUT': 300})
+    def test_local_token_cache_staleness_bound(self):
+        self.client.get(reverse('user-profile')) # Cache the token
+        # Revoked by another worker: this process's cache doesn't hear of it...
+        Token.objects.filter(pk=self.token.pk).delete()
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 200)
+        # ...until the entry expires
+        cache = get_token_cache()._cache
+        with mock.patch.object(cache, '_clock', lambda: time.monotonic() + 300):
+            self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+
+    def test_google_login(self):
+        with self.assertMaxQueries(3):
+            response = self.client_class().post(reverse('google-login'), {'access_token': 'valid-google-token'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user_id'], self.user.pk)
+
+    def test_google_first_login(self):
+        # The email's local part is already someone's username
+        user, token = google_login({'email': 'user5@elsewhere.example', 'given_name': 'Grace'})
+        self.assertRegex(user.username, r'^user5-[0-9a-f]{6}$')
+        self.assertEqual((user.email, user.first_name), ('user5@elsewhere.example', 'Grace'))
+
+        # A concurrent first login created the account between the lookup and the insert
+        lookup, missed = CustomUser.objects.filter_by_email, [CustomUser.objects.none()]
+        with mock.patch.object(CustomUser.objects, 'filter_by_email', lambda email: missed.pop() if missed else lookup(email)):
+            user, token = google_login({'email': 'USER0@example.com'})
+        self.assertEqual(user, self.user)
+
+    def test_google_client_is_reused(self):
+        reset_clients()
+        # Distinct access tokens, so every login reaches (the stub of) Google
+        with mock.patch('users.google.httpx.Client', wraps=httpx.Client) as client_class:
+            for route, access_token in [('google-login', 'valid-1'), ('google-login', 'valid-2'), ('async-google-login', 'valid-3')]:
+                response = self.client_class().post(reverse(route), {'access_token': access_token}, content_type='application/json')
+                self.assertEqual(response.status_code, 200)
+        # One pooled client for the process, including for the async view under WSGI
+        self.assertEqual(client_class.call_count, 1)
+
+        async def login_twice():
+            for access_token in ('valid-4', 'valid-5'):
+                response = await AsyncClient().post(reverse('async-google-login'), {'access_token': access_token}, content_type='application/json')
+                self.assertEqual(response.status_code, 200)
+        with mock.patch('users.google.httpx.AsyncClient', wraps=httpx.AsyncClient) as async_client_class:
+            async_to_sync(login_twice)()
+        # Under ASGI, one client for the event loop
+        self.assertEqual(async_client_class.call_count, 1)
+
+    def test_bootstrap(self):
+        with self.assertMaxQueries(5):
+            response = self.client.get(reverse('session-bootstrap'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['favorites']['count'], len(response.data['favorites']['recipe_ids'])), (25, 25))
+        self.assertEqual((response.data['ratings']['count'], len(response.data['ratings']['by_recipe'])), (40, 40))
+        self.assertIsNone(response.data['ratings']['next'])
+        self.assertMaxResponseSize(response, 2 * 1024)
+
+    def test_bootstrap_is_capped(self):
+        with self.assertMaxQueries(7): # Both lists have more than a page, so the totals take a query each
+            response = self.client.get(reverse('session-bootstrap'), {'page_size': 10})
+        favorites, ratings = response.data['favorites'], response.data['ratings']
+        self.assertEqual((favorites['count'], len(favorites['recipe_ids'])), (25, 10))
+        self.assertEqual((ratings['count'], len(ratings['by_recipe'])), (40, 10))
+        expected = RecipeRating.objects.filter(user=self.user).aggregate(average=Avg('rating'))['average']
+        self.assertEqual(ratings['average'], round(expected, 2))
+        # The next links continue in the list endpoints
+        rest = self.client.get(favorites['next']).data['results']
+        self.assertEqual(len(favorites['recipe_ids']) + len(rest), 25)
+        self.assertFalse({item['recipe'] for item in rest} & set(favorites['recipe_ids']))
+        rest = self.client.get(ratings['next']).data['results']
+        self.assertEqual(len(rest), 30)
+
+    def test_import_users(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='') as fh:
+            writer = csv.writer(fh)
+            writer.writerow(['username', 'email', 'password', 'region', 'dietary_preferences'])
+            for i in range(40):
+                writer.writerow([f'imported{i}', f'imported{i}@example.com', PASSWORD, 'ng', 'Vegan; keto' if i % 2 else ''])
+            writer.writerow(['user0', 'someone@example.com', PASSWORD, '', '']) # Username taken
+            writer.writerow(['another', 'USER1@example.com', PASSWORD, '', '']) # Email taken
+            writer.writerow(['imported0', 'again@example.com', PASSWORD, '', '']) # Earlier in the file
+            writer.writerow(['shorty', 'shorty@example.com', 'short', '', ''])
+            writer.writerow(['tagged', 'tagged@example.com', PASSWORD, '', 'x' * 51])
+            fh.flush()
+            # Queries are per batch of 10, not per row
+            with self.assertMaxQueries(32):
+                call_command('import_users', fh.name, batch_size=10, processes=1, stdout=StringIO(), stderr=StringIO())
+
+        imported = CustomUser.objects.filter(username__startswith='imported')
+        self.assertEqual(imported.count(), 40)
+        user = imported.get(username='imported1')
+        self.assertTrue(user.check_password(PASSWORD))
+        self.assertEqual(user.region, 'ng')
+        self.assertEqual(set(user.dietary_preferences.tags.values_list('name', flat=True)), {'vegan', 'keto'})
+        self.assertEqual(DietaryPreference.objects.filter(user__in=imported).count(), 20)
+        self.assertFalse(CustomUser.objects.filter(username__in=['another', 'shorty', 'tagged']).exists())
@@ -0,0 +1,197 @@
+# users/throttling.py
+#
+# Token-bucket throttles for the endpoints that check a password. Every login or password
+# change attempt costs a full password hash, so a credential-stuffing burst can pin every
+# worker's CPU; DRF runs throttles before the view, so rejected attempts never reach the hasher.
+
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+from .caching import TTLCache
+
+logger = logging.getLogger('users.throttling')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BACKEND': 'local',  # 'local', 'django', or the dotted path of a store class
+    'CACHE_ALIAS': 'default',  # CACHES alias used by the 'django' backend
+    'MAX_ENTRIES': 100000,  # Buckets kept by the 'local' backend
+    'RATES': {'ip': '30/min', 'account': '10/min'},  # Burst size / time to refill it
+    'LOG_EVERY': 100,  # Log the rejection counters every N rejections (0 disables)
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LOGIN_THROTTLE', {})}
+
+
+def parse_rate(rate):
+    """'10/min' -> (capacity 10, refill 10/60 tokens per second), like DRF's rate strings."""
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def _take(state, capacity, refill_rate, now):
+    """Refill a (tokens, updated_at) bucket and take one token; returns (new state, seconds to wait)."""
+    tokens, updated_at = state or (capacity, now)
+    tokens = min(capacity, tokens + max(0, now - updated_at) * refill_rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / refill_rate
+
+
+class LocalBucketStore:
+    """Buckets in this process only: each worker enforces the rates on its own."""
+    def __init__(self, max_entries, **kwargs):
+        self._buckets = TTLCache(max_entries=max_entries)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_rate, now):
+        with self._lock:
+            state, wait = _take(self._buckets.get(key), capacity, refill_rate, now)
+            # A bucket left alone this long is full again, the same as a missing one
+            self._buckets.set(key, state, timeout=capacity / refill_rate)
+        return wait
+
+
+class DjangoBucketStore:
+    """
+    Buckets in one of the CACHES aliases, shared by every worker using it. The read-update-
+    write isn't atomic, so concurrent attempts on one key may each get the same token.
+    """
+    def __init__(self, cache_alias='default', **kwargs):
+        self._cache = caches[cache_alias]
+
+    def take(self, key, capacity, refill_rate, now):
+        state, wait = _take(self._cache.get(key), capacity, refill_rate, now)
+        self._cache.set(key, state, int(capacity / refill_rate) + 1)
+        return wait
+
+
+BUCKET_STORES = {
+    'local': LocalBucketStore,
+    'django': DjangoBucketStore,
+}
+
+_bucket_store = None
+
+
+def get_bucket_store():
+    global _bucket_store
+    if _bucket_store is None:
+        config = get_config()
+        backend = BUCKET_STORES.get(config['BACKEND']) or import_string(config['BACKEND'])
+        _bucket_store = backend(max_entries=config['MAX_ENTRIES'], cache_alias=config['CACHE_ALIAS'])
+    return _bucket_store
+
+
+def reset_bucket_store():
+    """Forget the store (and, for 'local', every bucket); rebuilt on next use."""
+    global _bucket_store
+    _bucket_store = None
+
+
+@receiver(setting_changed)
+def _reset_bucket_store(setting, **kwargs):
+    if setting == 'LOGIN_THROTTLE':
+        reset_bucket_store()
+
+
+class ThrottleStats:
+    """Attempts and rejections per throttle scope, counted by this process."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._attempts = Counter()
+        self._rejected = Counter()
+
+    def record(self, scope, allowed):
+        with self._lock:
+            self._attempts[scope] += 1
+            if not allowed:
+                self._rejected[scope] += 1
+            return sum(self._rejected.values())
+
+    def snapshot(self):
+        with self._lock:
+            return {'attempts': dict(self._attempts), 'rejected': dict(self._rejected)}
+
+    def reset(self):
+        with self._lock:
+            self._attempts.clear()
+            self._rejected.clear()
+
+
+throttle_stats = ThrottleStats()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Takes one token from the bucket of the request's key; rejects the request when it's empty.
+    Subclasses set `scope` (a key of LOGIN_THROTTLE['RATES']) and define
+    `get_key(request, view)`, returning the bucket to charge or None to let the request
+    through; both are checked when the subclass is defined.
+    """
+    scope = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.scope is None or not callable(getattr(cls, 'get_key', None)):
+            raise ImproperlyConfigured(f'{cls.__name__} must set scope and define get_key(request, view).')
+
+    def allow_request(self, request, view):
+        config = get_config()
+        key = self.get_key(request, view) if config['ENABLED'] else None
+        if key is None:
+            return True
+        capacity, refill_rate = parse_rate(config['RATES'][self.scope])
+        # Never use raw identifiers as cache keys, shared caches may be inspectable
+        key = f'users:throttle:{self.scope}:' + hashlib.sha256(key.encode()).hexdigest()
+        self.wait_seconds = get_bucket_store().take(key, capacity, refill_rate, time.time())
+
+        allowed = not self.wait_seconds
+        rejected = throttle_stats.record(self.scope, allowed)
+        if not allowed and config['LOG_EVERY'] and rejected % config['LOG_EVERY'] == 0:
+            logger.warning('Throttled password attempts: %s', throttle_stats.snapshot())
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class PasswordAttemptIPThrottle(TokenBucketThrottle):
+    """One bucket per client IP (see DRF's NUM_PROXIES for clients behind proxies)."""
+    scope = 'ip'
+
+    def get_key(self, request, view):
+        return self.get_ident(request)
+
+
+class PasswordAttemptAccountThrottle(TokenBucketThrottle):
+    """
+    One bucket per targeted account: the signed-in user, or the username/email a login
+    names (as typed, lowercased; resolving it to a user would cost a query per attempt).
+    """
+    scope = 'account'
+
+    def get_key(self, request, view):
+        if request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        data = request.data if hasattr(request.data, 'get') else {}
+        identifier = data.get('username') or data.get('email')
+        if not isinstance(identifier, str) or not identifier.strip():
+            return None # Rejected by the serializer without hashing anything
+        return 'login:' + identifier.strip().lower()
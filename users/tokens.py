@@ -0,0 +1,47 @@
+# users/tokens.py
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .authentication import get_token_ttl, invalidate_token, invalidate_user_tokens, is_token_expired
+
+
+def issue_token(user):
+    """Return the user's current token, replacing it first if it has expired."""
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and is_token_expired(token):
+        token = rotate_token(user)
+    return token
+
+
+def rotate_token(user):
+    """Revoke every token of the user and issue a fresh one (login after expiry, password change)."""
+    with transaction.atomic():
+        Token.objects.filter(user=user).delete()
+        token = Token.objects.create(user=user)
+    invalidate_user_tokens(user.pk)
+    return token
+
+
+def revoke_token(token):
+    """Delete a token so it can no longer authenticate (logout)."""
+    Token.objects.filter(pk=token.pk).delete()
+    invalidate_token(token.key)
+
+
+def purge_expired_tokens(batch_size=1000):
+    """
+    Delete expired tokens in batches of `batch_size` so the table stays small and no single
+    statement holds locks for long. Returns the number of tokens deleted.
+    """
+    ttl = get_token_ttl()
+    if ttl is None:
+        return 0
+    cutoff = timezone.now() - ttl
+    deleted = 0
+    while True:
+        keys = list(Token.objects.filter(created__lte=cutoff).values_list('pk', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += Token.objects.filter(pk__in=keys).delete()[0]
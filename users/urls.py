@@ -1,10 +1,11 @@
-from django.urls import path, include
-from .views import UserLoginView, UserRegistrationView, UserProfileView, VerifyContributorView, DietaryPreferenceView, ChangePasswordView, UserLogoutView, GoogleLoginView
+from django.urls import path
+from meal_project.async_views import select_view
+from .views import AsyncGoogleLoginView, AsyncUserProfileView, UserLoginView, UserRegistrationView, UserProfileView, VerifyContributorView, DietaryPreferenceView, ChangePasswordView, UserLogoutView, GoogleLoginView, SessionBootstrapView
 
 urlpatterns = [
     path('register/', UserRegistrationView.as_view(), name='user-registration'),
     path('login/', UserLoginView.as_view(), name='user-login'),
-    path('profile/', UserProfileView.as_view(), name='user-profile'),
+    path('profile/', select_view(UserProfileView, AsyncUserProfileView), name='user-profile'),
     path('verify/<int:user_id>/', VerifyContributorView.as_view(), name='verify-contributor'),
     path('preferences/', DietaryPreferenceView.as_view(), name='dietary-preferences'),
     path('preferences/<int:user_id>/', DietaryPreferenceView.as_view(), name='dietary-preferences-user'),
@@ -12,5 +13,9 @@ urlpatterns = [
     path('preferences/<int:user_id>/delete/', DietaryPreferenceView.as_view(), name='dietary-preferences-delete'),
     path('change-password/', ChangePasswordView.as_view(), name='change-password'),
     path('logout/', UserLogoutView.as_view(), name='user-logout'),
-    path('google-login/', GoogleLoginView.as_view(), name='google-login'),
+    path('google-login/', select_view(GoogleLoginView, AsyncGoogleLoginView), name='google-login'),
+    path('bootstrap/', SessionBootstrapView.as_view(), name='session-bootstrap'),
+    # Async variant, whatever settings.ASYNC_VIEWS says
+    path('async/profile/', AsyncUserProfileView.as_view(), name='async-user-profile'),
+    path('async/google-login/', AsyncGoogleLoginView.as_view(), name='async-google-login'),
 ]
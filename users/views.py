@@ -1,15 +1,76 @@
-from django.shortcuts import render
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token # Import Token model for authentication
 from .serializers import DietaryPreferenceSerializer, UserRegistrationSerializer, UserLoginSerializer, UserProfileUpdateSerializer
 from rest_framework.permissions import IsAuthenticated #import the new login serializer
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
 from .permissions import IsAdminUser # Import the custom permission class
-from .models import CustomUser, DietaryPreference # Import your CustomUser model
+from .throttling import PasswordAttemptAccountThrottle, PasswordAttemptIPThrottle
+from .tokens import issue_token, revoke_token, rotate_token
+from .models import CustomUser, DietaryPreference, DietaryTag # Import your CustomUser model
+from .caching import aget_cached_payload, aget_payload_version, get_cached_payload, get_payload_version, payload_digest, payload_etag
+from meal_project.async_views import AsyncAPIView
+from rating.models import FavoriteRecipe, RecipeRating
+from rating.pagination import KeysetPagination
 from django.contrib.auth import logout # Import logout function
-import requests
 from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from django.urls import reverse
+from django.utils.http import parse_etags
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from rest_framework.utils.urls import replace_query_param
+import json
+import secrets
+from .google import GoogleAuthError, GoogleUnavailableError, afetch_userinfo, fetch_userinfo
+
+def build_profile_payload(user):
+    # request.user may come from the token cache, so serialize the row as it is now
+    return UserProfileUpdateSerializer(CustomUser.objects.get(pk=user.pk)).data
+
+async def abuild_profile_payload(user):
+    return UserProfileUpdateSerializer(await CustomUser.objects.aget(pk=user.pk)).data
+
+def build_preferences_payload(user):
+    # Users without a preference row simply have no tags
+    names = DietaryTag.objects.filter(preferences__user=user).values_list('name', flat=True)
+    return {'preferences': list(names)}
+
+USER_PAYLOAD_BUILDERS = {
+    'profile': build_profile_payload,
+    'preferences': build_preferences_payload,
+}
+
+def get_user_payload(user, name, version=None):
+    """The user's `name` payload from the per-user payload cache."""
+    if version is None:
+        version = get_payload_version(user.pk)
+    return get_cached_payload(name, user.pk, version, lambda: USER_PAYLOAD_BUILDERS[name](user))
+
+def cached_user_payload_response(request, name):
+    """
+    Respond with the user's `name` payload from the per-user payload cache, or with a 304
+    when the client's If-None-Match already holds the current version's ETag. With payload
+    caching off, the payload is built first and the ETag derived from it.
+    """
+    payload, version = None, get_payload_version(request.user.pk)
+    if version is None:
+        payload = USER_PAYLOAD_BUILDERS[name](request.user)
+        version = payload_digest(payload)
+    etag = payload_etag(name, request.user.pk, version)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if payload is None:
+        payload = get_user_payload(request.user, name, version)
+    return Response(payload, status=status.HTTP_200_OK, headers=headers)
 
 class UserRegistrationView(APIView):
     def post(self, request):
@@ -20,11 +81,13 @@ class UserRegistrationView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class UserLoginView(APIView):
+    throttle_classes = [PasswordAttemptIPThrottle, PasswordAttemptAccountThrottle] # Checked before any password is hashed
+
     def post(self, request):
-        serializer = UserLoginSerializer(data=request.data)
+        serializer = UserLoginSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             user = serializer.validated_data['user']
-            token, created = Token.objects.get_or_create(user=user) # Get or create a token for the user
+            token = issue_token(user) # Reuse the user's token, or rotate it if it has expired
             return Response({
                 'message': 'Login successful.',
                 'token': token.key,
@@ -40,9 +103,8 @@ class UserProfileView(APIView):
     permission_classes = [IsAuthenticated] # <--- This ensures only logged-in users can access
 
     def get(self, request):
-        # Retrieve and return the current user's profile
-        serializer = UserProfileUpdateSerializer(request.user)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Retrieve and return the current user's profile (cached, invalidated when the user is saved)
+        return cached_user_payload_response(request, 'profile')
 
     def put(self, request):
         # Update the current user's profile
@@ -52,6 +114,25 @@ class UserProfileView(APIView):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+class AsyncUserProfileView(AsyncAPIView):
+    """GET of UserProfileView on the event loop (see meal_project/async_views.py); PUT goes to the sync view."""
+    sync_view = UserProfileView
+
+    async def get(self, request):
+        user = request.user
+        payload, version = None, await aget_payload_version(user.pk)
+        if version is None:
+            payload = await abuild_profile_payload(user)
+            version = payload_digest(payload)
+        etag = payload_etag('profile', user.pk, version)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        if payload is None:
+            payload = await aget_cached_payload('profile', user.pk, version, lambda: abuild_profile_payload(user))
+        return JsonResponse(payload, status=status.HTTP_200_OK, headers=headers)
+
 class VerifyContributorView(APIView):
     permission_classes = [IsAuthenticated, IsAdminUser] # <--- Requires login AND admin role
 
@@ -78,15 +159,23 @@ class VerifyContributorView(APIView):
 class DietaryPreferenceView(APIView):
     permission_classes = [IsAuthenticated] # Only authenticated users can manage their preferences
 
-    def get(self, request):
-        # Get or create the dietary preference object for the current user
-        preference, created = DietaryPreference.objects.get_or_create(user=request.user)
-        serializer = DietaryPreferenceSerializer(preference)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # The preferences/<user_id>/... routes can only address the caller's own preferences
+        user_id = kwargs.get('user_id')
+        if user_id is not None and user_id != request.user.pk:
+            raise PermissionDenied('You can only manage your own dietary preferences.')
 
-    def put(self, request):
-        # Update the dietary preferences for the current user
-        preference, created = DietaryPreference.objects.get_or_create(user=request.user)
+    def get(self, request, user_id=None):
+        # Read-only and cached; invalidated whenever the tags change or the row is deleted
+        return cached_user_payload_response(request, 'preferences')
+
+    def put(self, request, user_id=None):
+        # Update the dietary preferences for the current user, read fresh rather than from the token cache
+        user = CustomUser.objects.filter(pk=request.user.pk, is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed('User inactive or deleted.')
+        preference, created = DietaryPreference.objects.get_or_create_for(user)
         serializer = DietaryPreferenceSerializer(preference, data=request.data)
         if serializer.is_valid():
             serializer.save()
@@ -95,7 +184,7 @@ class DietaryPreferenceView(APIView):
 
     # Note: You might also consider a PATCH method for partial updates,
     # but for a single TextField of preferences, PUT works fine.
-    def delete(self, request):
+    def delete(self, request, user_id=None):
         # Delete the dietary preferences for the current user
         try:
             preference = DietaryPreference.objects.get(user=request.user)
@@ -106,6 +195,7 @@ class DietaryPreferenceView(APIView):
         
 class ChangePasswordView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [PasswordAttemptIPThrottle, PasswordAttemptAccountThrottle]
 
     def post(self, request):
         user = request.user
@@ -117,52 +207,169 @@ class ChangePasswordView(APIView):
 
         user.set_password(new_password)
         user.save()
-        return Response({'detail': 'Password changed successfully.'}, status=status.HTTP_200_OK)
+        token = rotate_token(user) # Sign out every other client still holding the old token
+        return Response({'detail': 'Password changed successfully.', 'token': token.key}, status=status.HTTP_200_OK)
 # Note: This view allows users to change their password.
 # It checks the old password, sets the new password, and saves the user.
 
+def first_keyset_page(request, queryset, list_view_name):
+    """
+    The first page of `queryset` as the `list_view_name` endpoint pages it (rating/pagination.py),
+    whether there is more, and the URL of that endpoint's next page.
+    """
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    if not paginator.has_next:
+        return page, False, None
+    url = request.build_absolute_uri(reverse(list_view_name))
+    return page, True, replace_query_param(url, paginator.cursor_query_param, paginator.encode_cursor(page[-1]))
+
+class SessionBootstrapView(APIView):
+    """
+    Everything a client loads on start-up in one round trip: profile, dietary preferences,
+    and the newest page of favorite recipe IDs and ratings with their totals. Profile and
+    preferences come from the payload cache; `next` links continue the favorites and ratings
+    in their list endpoints, and the totals are only aggregated when there is more than a page.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        version = get_payload_version(user.pk)
+        favorites, more_favorites, favorites_next = first_keyset_page(
+            request, FavoriteRecipe.objects.filter(user=user).only('id', 'recipe_id', 'created_at'), 'favorite-recipes-list-create',
+        )
+        ratings, more_ratings, ratings_next = first_keyset_page(
+            request, RecipeRating.objects.filter(user=user).only('id', 'recipe_id', 'rating', 'created_at'), 'recipe-ratings-list-create',
+        )
+        if more_ratings:
+            totals = RecipeRating.objects.filter(user=user).aggregate(count=Count('id'), average=Avg('rating'))
+        else:
+            totals = {'count': len(ratings), 'average': sum(rating.rating for rating in ratings) / len(ratings) if ratings else None}
+        return Response({
+            'profile': get_user_payload(user, 'profile', version),
+            'preferences': get_user_payload(user, 'preferences', version)['preferences'],
+            'favorites': {
+                'count': FavoriteRecipe.objects.filter(user=user).count() if more_favorites else len(favorites),
+                'recipe_ids': [favorite.recipe_id for favorite in favorites],
+                'next': favorites_next,
+            },
+            'ratings': {
+                'count': totals['count'],
+                'average': round(totals['average'], 2) if totals['average'] is not None else None,
+                'by_recipe': {rating.recipe_id: rating.rating for rating in ratings},
+                'next': ratings_next,
+            },
+        }, status=status.HTTP_200_OK)
+
 class UserLogoutView(APIView):
     permission_classes = [IsAuthenticated] # Only authenticated users can log out
 
     def post(self, request):
         logout(request) # Invalidate the session
+        if isinstance(request.auth, Token):
+            revoke_token(request.auth) # The API authenticates with tokens, so revoke it too
         return Response({'message': 'Logged out successfully'}, status=status.HTTP_200_OK)
 
+def available_username(email):
+    """The email's local part, or that plus a random suffix when someone already has it as a username."""
+    User = get_user_model()
+    base = email.split('@')[0][:User._meta.get_field('username').max_length - 7]
+    username = base
+    while User.objects.filter(username=username).exists():
+        username = f'{base}-{secrets.token_hex(3)}'
+    return username
+
+def google_login(userinfo):
+    """The user matching Google's `userinfo` (created on first login) and their API token."""
+    email = userinfo['email']
+    User = get_user_model()
+    user = User.objects.filter_by_email(email).first()
+    created, conflicts = False, 0
+    while user is None:
+        try:
+            with transaction.atomic():
+                user = User.objects.create(
+                    email=email,
+                    username=available_username(email),
+                    first_name=userinfo.get('given_name', ''),
+                    last_name=userinfo.get('family_name', ''),
+                    is_active=True,
+                )
+            created = True
+        except IntegrityError:
+            # A concurrent first login with this email won, or someone took the username meanwhile
+            user = User.objects.filter_by_email(email).first()
+            conflicts += 1
+            if user is None and conflicts == 3:
+                raise
+    # Optionally update user info, only writing when Google's copy changed
+    if not created:
+        first_name = userinfo.get('given_name', user.first_name)
+        last_name = userinfo.get('family_name', user.last_name)
+        if (first_name, last_name) != (user.first_name, user.last_name):
+            user.first_name, user.last_name = first_name, last_name
+            user.save(update_fields=['first_name', 'last_name'])
+    return user, issue_token(user)
+
+def google_login_payload(user, token):
+    return {
+        'token': token.key,
+        'user_id': user.pk,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name
+    }
+
 class GoogleLoginView(APIView):
+    """Signs in with a Google access token, verified with the pooled client from users/google.py."""
     def post(self, request):
-        access_token = request.data.get('access_token')
+        access_token = request.data.get('access_token') if hasattr(request.data, 'get') else None
         if not access_token:
             return Response({'error': 'Access token is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Verify the token with Google
-        google_userinfo_url = 'https://www.googleapis.com/oauth2/v3/userinfo'
-        resp = requests.get(google_userinfo_url, headers={'Authorization': f'Bearer {access_token}'})
-        if resp.status_code != 200:
+        try:
+            userinfo = fetch_userinfo(access_token)
+        except GoogleAuthError:
             return Response({'error': 'Invalid Google access token.'}, status=status.HTTP_400_BAD_REQUEST)
-        userinfo = resp.json()
-        email = userinfo.get('email')
-        if not email:
+        except GoogleUnavailableError:
+            return Response({'error': 'Google is unavailable, please retry.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if not userinfo.get('email'):
             return Response({'error': 'Google account email not found.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        User = get_user_model()
-        user, created = User.objects.get_or_create(email=email, defaults={
-            'username': email.split('@')[0],
-            'first_name': userinfo.get('given_name', ''),
-            'last_name': userinfo.get('family_name', ''),
-            'is_active': True
-        })
-        # Optionally update user info
-        if not created:
-            user.first_name = userinfo.get('given_name', user.first_name)
-            user.last_name = userinfo.get('family_name', user.last_name)
-            user.save()
-
-        token, _ = Token.objects.get_or_create(user=user)
-        return Response({
-            'token': token.key,
-            'user_id': user.pk,
-            'username': user.username,
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        user, token = google_login(userinfo)
+        return Response(google_login_payload(user, token), status=status.HTTP_200_OK)
+
+@method_decorator(csrf_exempt, name='dispatch') # Token-based API endpoint, like the APIViews above
+class AsyncGoogleLoginView(View):
+    """
+    GoogleLoginView on the event loop, so the Google round trip doesn't hold a worker thread
+    under ASGI. The user lookup and token write run in a worker thread.
+    """
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b'{}') if request.content_type == 'application/json' else request.POST
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body.'}, status=status.HTTP_400_BAD_REQUEST)
+        access_token = data.get('access_token') if hasattr(data, 'get') else None
+        if not access_token:
+            return JsonResponse({'error': 'Access token is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Verify the token with Google. Under WSGI this view runs in an event loop of its own,
+        # which would get (and drop) a new async client every time: use the process-wide one
+        try:
+            if isinstance(request, ASGIRequest):
+                userinfo = await afetch_userinfo(access_token)
+            else:
+                userinfo = await sync_to_async(fetch_userinfo, thread_sensitive=False)(access_token)
+        except GoogleAuthError:
+            return JsonResponse({'error': 'Invalid Google access token.'}, status=status.HTTP_400_BAD_REQUEST)
+        except GoogleUnavailableError:
+            return JsonResponse({'error': 'Google is unavailable, please retry.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if not userinfo.get('email'):
+            return JsonResponse({'error': 'Google account email not found.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user, token = await sync_to_async(google_login)(userinfo)
+        return JsonResponse(google_login_payload(user, token), status=status.HTTP_200_OK)